@@ -0,0 +1,215 @@
+'''
+Business: Idempotency keys for mutating actions so gateway retries replay the first response
+Args: Idempotency-Key header (or idempotency_key body field) on a POST, the handler's mutating actions
+Returns: the stored response when the key was seen before, otherwise the handler's response after recording it
+
+A key is claimed in idempotency_keys before the action runs and the response is
+stored after it, so a retry that arrives while the first attempt is still running
+gets 409 instead of executing twice. 5xx responses and exceptions release the
+claim so the client may retry. A claim is only held for IDEMPOTENCY_LEASE seconds
+(about the function timeout): if the invocation was killed or could not record its
+response, a retry after the lease takes the key over instead of getting 409 until
+the key expires. Storing and releasing are tied to the claim's created_at, so a
+superseded attempt cannot overwrite its successor's row. Finished responses are
+also kept in an in-process LRU, so hot replays return without a database round trip.
+
+The claim and the stored response use their own connection, not the action's
+transaction. If the invocation dies after the action committed but before its
+response was stored, the key is left unfinished and is free again once the lease
+runs out: a retry then runs the action a second time. Keys narrow the window for
+double execution to that gap; they do not close it.
+'''
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+from db import get_db_connection
+from router import parse_body
+
+KEY_TTL_SECONDS = int(os.environ.get('IDEMPOTENCY_TTL', '86400'))
+LEASE_SECONDS = int(os.environ.get('IDEMPOTENCY_LEASE', '60'))
+CACHE_SIZE = 5000
+CLEANUP_INTERVAL_SECONDS = 60
+CLEANUP_BATCH = 500
+MAX_KEY_LENGTH = 128
+HEADER = 'idempotency-key'
+
+CLAIM_SQL = '''
+INSERT INTO idempotency_keys (user_id, key, action, expires_at, locked_until)
+VALUES (%s, %s, %s, clock_timestamp() + make_interval(secs => %s), clock_timestamp() + make_interval(secs => %s))
+ON CONFLICT (user_id, key) DO UPDATE
+SET action = EXCLUDED.action, status_code = NULL, response = NULL, created_at = clock_timestamp(),
+    expires_at = EXCLUDED.expires_at, locked_until = EXCLUDED.locked_until
+WHERE idempotency_keys.expires_at < clock_timestamp()
+   OR (idempotency_keys.status_code IS NULL AND idempotency_keys.locked_until < clock_timestamp())
+RETURNING created_at
+'''
+
+LOOKUP_SQL = "SELECT action, status_code, response FROM idempotency_keys WHERE user_id = %s AND key = %s"
+
+STORE_SQL = '''
+UPDATE idempotency_keys SET status_code = %s, response = %s
+WHERE user_id = %s AND key = %s AND created_at = %s
+'''
+
+RELEASE_SQL = '''
+DELETE FROM idempotency_keys
+WHERE user_id = %s AND key = %s AND created_at = %s AND status_code IS NULL
+'''
+
+CLEANUP_SQL = '''
+DELETE FROM idempotency_keys WHERE ctid IN (
+    SELECT ctid FROM idempotency_keys WHERE expires_at < clock_timestamp() LIMIT %s
+)
+'''
+
+JSON_HEADERS = {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}
+
+# (user_id, key) -> (expires_at epoch, action, response)
+_responses: 'OrderedDict[Tuple[int, str], Tuple[float, str, Dict[str, Any]]]' = OrderedDict()
+_lock = threading.Lock()
+_last_cleanup = 0.0
+
+
+def _error(status: int, message: str) -> Dict[str, Any]:
+    return {'statusCode': status, 'headers': dict(JSON_HEADERS), 'body': json.dumps({'error': message})}
+
+
+def _replayed(response: Dict[str, Any]) -> Dict[str, Any]:
+    replay = dict(response)
+    replay['headers'] = dict(response.get('headers') or {}, **{'Idempotent-Replayed': 'true'})
+    return replay
+
+
+def _cached(user_id: int, key: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+    with _lock:
+        hit = _responses.get((user_id, key))
+        if hit is None:
+            return None
+        if hit[0] <= time.time():
+            del _responses[(user_id, key)]
+            return None
+        _responses.move_to_end((user_id, key))
+        return hit[1], hit[2]
+
+
+def _remember(user_id: int, key: str, action: str, response: Dict[str, Any]) -> None:
+    with _lock:
+        _responses[(user_id, key)] = (time.time() + KEY_TTL_SECONDS, action, response)
+        _responses.move_to_end((user_id, key))
+        while len(_responses) > CACHE_SIZE:
+            _responses.popitem(last=False)
+
+
+def request_key(event: Dict[str, Any], actions: Iterable[str]) -> Optional[Tuple[int, str, str]]:
+    '''(user_id, key, action) for a keyed POST of a mutating action; None when the request is not keyed.'''
+    if event.get('httpMethod') != 'POST':
+        return None
+    try:
+        body = parse_body(event)
+    except ValueError:
+        return None
+    if not isinstance(body, dict) or body.get('action') not in actions:
+        return None
+
+    headers = {str(name).lower(): value for name, value in (event.get('headers') or {}).items()}
+    key = headers.get(HEADER) or body.get('idempotency_key')
+    if not key:
+        return None
+    # Keys are scoped per user; without one, two callers could share a key and see each other's response
+    try:
+        user_id = int(body.get('user_id'))
+    except (TypeError, ValueError):
+        return None
+    if user_id <= 0:
+        return None
+    return user_id, str(key), body['action']
+
+
+def _cleanup(cur: Any) -> None:
+    global _last_cleanup
+    now = time.time()
+    if now - _last_cleanup < CLEANUP_INTERVAL_SECONDS:
+        return
+    _last_cleanup = now
+    cur.execute(CLEANUP_SQL, (CLEANUP_BATCH,))
+
+
+def _claim(user_id: int, key: str, action: str) -> Tuple[Any, Optional[Tuple[str, Optional[int], Any]]]:
+    '''(claim token, None) when this request now owns the key, otherwise (None, stored (action, status_code, response)).'''
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        _cleanup(cur)
+        cur.execute(CLAIM_SQL, (user_id, key, action, KEY_TTL_SECONDS, LEASE_SECONDS))
+        claimed = cur.fetchone()
+        stored = None
+        if claimed is None:
+            cur.execute(LOOKUP_SQL, (user_id, key))
+            stored = cur.fetchone() or (action, None, None)
+        conn.commit()
+        return (claimed[0] if claimed else None), stored
+    finally:
+        cur.close()
+        conn.close()
+
+
+def _finish(user_id: int, key: str, claimed_at: Any, response: Optional[Dict[str, Any]]) -> None:
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        if response is None or response.get('statusCode', 500) >= 500:
+            cur.execute(RELEASE_SQL, (user_id, key, claimed_at))
+        else:
+            cur.execute(STORE_SQL, (response['statusCode'], json.dumps(response), user_id, key, claimed_at))
+        conn.commit()
+    finally:
+        cur.close()
+        conn.close()
+
+
+def idempotent(actions: Iterable[str]) -> Callable:
+    '''Handler decorator: keyed requests for `actions` run at most once per (user_id, key).'''
+    actions = frozenset(actions)
+
+    def decorate(fn: Callable[..., Dict[str, Any]]) -> Callable[..., Dict[str, Any]]:
+        @wraps(fn)
+        def wrapper(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+            keyed = request_key(event, actions)
+            if keyed is None:
+                return fn(event, context)
+            user_id, key, action = keyed
+            if len(key) > MAX_KEY_LENGTH:
+                return _error(400, f'Idempotency key longer than {MAX_KEY_LENGTH} characters')
+
+            hit = _cached(user_id, key)
+            claimed_at = None
+            if hit is None:
+                claimed_at, stored = _claim(user_id, key, action)
+                if stored is not None:
+                    if stored[1] is None:
+                        return _error(409, 'A request with this idempotency key is still in progress')
+                    response = stored[2] if isinstance(stored[2], dict) else json.loads(stored[2])
+                    hit = (stored[0], response)
+                    _remember(user_id, key, stored[0], response)
+
+            if hit is not None:
+                if hit[0] != action:
+                    return _error(422, 'Idempotency key was already used for a different action')
+                return _replayed(hit[1])
+
+            response = None
+            try:
+                response = fn(event, context)
+            finally:
+                _finish(user_id, key, claimed_at, response)
+            if response.get('statusCode', 500) < 500:
+                _remember(user_id, key, action, response)
+            return response
+        return wrapper
+    return decorate
@@ -4,181 +4,341 @@ Args: event with httpMethod, body with admin actions
 Returns: HTTP response with admin data
 '''
 
-import json
-import os
-import psycopg2
-from typing import Dict, Any
+import base64
+import math
+import re
+from datetime import datetime
+from typing import Dict, Any, Tuple
+from db import releases_connections, pool_stats, warm
+from idempotency import idempotent
+from metrics import instrumented, snapshot
+from profiling import profiled
+from router import Router, Request, JSON_HEADERS, NUMBER, respond, error
+from ledger import record
+import export
 
-def get_db_connection():
-    return psycopg2.connect(os.environ['DATABASE_URL'])
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+PROFILE_LIST_SIZE = 50
+MAX_CASE_PRIZES = 100
+CASE_ID_PATTERN = re.compile(r'^[a-z0-9_-]{1,50}$')
 
-def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
-    method: str = event.get('httpMethod', 'GET')
-    
-    if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': ''
-        }
-    
-    if method == 'POST':
-        body = json.loads(event.get('body', '{}'))
-        action = body.get('action')
-        user_id = body.get('user_id')
-        
-        if not user_id:
-            return {
-                'statusCode': 400,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Missing user_id'})
-            }
-        
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        cur.execute("SELECT is_admin FROM users WHERE id = %s", (user_id,))
-        admin_check = cur.fetchone()
-        
-        if not admin_check or not admin_check[0]:
-            cur.close()
-            conn.close()
-            return {
-                'statusCode': 403,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Access denied'})
-            }
-        
-        if action == 'get_stats':
-            cur.execute("SELECT COUNT(*) FROM users")
-            total_users = cur.fetchone()[0]
-            
-            cur.execute("SELECT SUM(balance) FROM users")
-            total_balance = cur.fetchone()[0] or 0
-            
-            cur.execute("SELECT COUNT(*) FROM case_openings")
-            total_cases = cur.fetchone()[0]
-            
-            cur.execute("SELECT SUM(prize_amount) FROM case_openings")
-            total_winnings = cur.fetchone()[0] or 0
-            
-            cur.close()
-            conn.close()
-            
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({
-                    'total_users': total_users,
-                    'total_balance': float(total_balance),
-                    'total_cases_opened': total_cases,
-                    'total_winnings': float(total_winnings)
-                })
-            }
-        
-        if action == 'get_users':
-            cur.execute(
-                "SELECT id, email, name, balance, is_admin, created_at FROM users ORDER BY created_at DESC LIMIT 100"
-            )
-            users = cur.fetchall()
-            
-            result = [{
-                'id': u[0],
-                'email': u[1],
-                'name': u[2],
-                'balance': float(u[3]),
-                'is_admin': u[4],
-                'created_at': u[5].isoformat()
-            } for u in users]
-            
-            cur.close()
-            conn.close()
-            
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps(result)
-            }
-        
-        if action == 'update_balance':
-            target_user_id = body.get('target_user_id')
-            new_balance = body.get('new_balance')
-            
-            if not target_user_id or new_balance is None:
-                cur.close()
-                conn.close()
-                return {
-                    'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Missing parameters'})
-                }
-            
-            cur.execute("UPDATE users SET balance = %s WHERE id = %s RETURNING balance", (new_balance, target_user_id))
-            updated_balance = cur.fetchone()
-            
-            if not updated_balance:
-                cur.close()
-                conn.close()
-                return {
-                    'statusCode': 404,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'User not found'})
-                }
-            
-            conn.commit()
-            cur.close()
-            conn.close()
-            
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'new_balance': float(updated_balance[0])})
-            }
-        
-        if action == 'make_admin':
-            target_user_id = body.get('target_user_id')
-            
-            if not target_user_id:
-                cur.close()
-                conn.close()
-                return {
-                    'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Missing target_user_id'})
-                }
-            
-            cur.execute("UPDATE users SET is_admin = TRUE WHERE id = %s RETURNING is_admin", (target_user_id,))
-            result = cur.fetchone()
-            
-            if not result:
-                cur.close()
-                conn.close()
-                return {
-                    'statusCode': 404,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'User not found'})
-                }
-            
-            conn.commit()
-            cur.close()
-            conn.close()
-            
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'success': True})
+CASES_SQL = '''
+SELECT c.id, c.name, c.price, c.active, c.sort_order, c.updated_at,
+       COALESCE(json_agg(json_build_object('amount', p.amount, 'chance', p.chance) ORDER BY p.id)
+                FILTER (WHERE p.id IS NOT NULL), '[]')
+FROM cases c LEFT JOIN case_prizes p ON p.case_id = c.id
+GROUP BY c.id
+ORDER BY c.sort_order, c.id
+'''
+
+UPSERT_CASE_SQL = '''
+INSERT INTO cases (id, name, price, active, sort_order) VALUES (%s, %s, %s, %s, %s)
+ON CONFLICT (id) DO UPDATE
+SET name = EXCLUDED.name, price = EXCLUDED.price, active = EXCLUDED.active,
+    sort_order = EXCLUDED.sort_order, updated_at = CURRENT_TIMESTAMP
+'''
+
+INSERT_PRIZES_SQL = '''
+INSERT INTO case_prizes (case_id, amount, chance)
+SELECT %s, t.amount, t.chance FROM unnest(%s::numeric[], %s::float8[]) WITH ORDINALITY AS t (amount, chance, n)
+ORDER BY t.n
+'''
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    return base64.urlsafe_b64encode(f'{created_at.isoformat()}|{row_id}'.encode()).decode()
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    created_at, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+    return datetime.fromisoformat(created_at), int(row_id)
+
+def escape_like(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+MUTATING_ACTIONS = ('update_balance', 'make_admin', 'save_case')
+
+
+router = Router()
+
+
+@router.action('get_stats', admin=True)
+def get_stats(req: Request) -> Dict[str, Any]:
+    req.cur.execute(
+        "SELECT COALESCE(SUM(total_users), 0), COALESCE(SUM(total_balance), 0), "
+        "COALESCE(SUM(total_cases_opened), 0), COALESCE(SUM(total_winnings), 0) FROM casino_stats"
+    )
+    total_users, total_balance, total_cases, total_winnings = req.cur.fetchone()
+
+    return respond({
+        'total_users': int(total_users),
+        'total_balance': float(total_balance),
+        'total_cases_opened': int(total_cases),
+        'total_winnings': float(total_winnings)
+    })
+
+
+@router.action('get_users', admin=True)
+def get_users(req: Request) -> Dict[str, Any]:
+    body = req.body
+    try:
+        page_size = min(max(int(body.get('limit', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+        after = decode_cursor(body['cursor']) if body.get('cursor') else None
+        min_balance = body.get('min_balance')
+        max_balance = body.get('max_balance')
+        min_balance = float(min_balance) if min_balance is not None else None
+        max_balance = float(max_balance) if max_balance is not None else None
+    except (TypeError, ValueError):
+        return error(400, 'Invalid pagination or filter parameters')
+
+    conditions = []
+    params = []
+
+    if after:
+        conditions.append("(created_at, id) < (%s, %s)")
+        params.extend(after)
+
+    search = body.get('search')
+    if isinstance(search, str) and search:
+        prefix = escape_like(search.lower()) + '%'
+        conditions.append("(lower(email) LIKE %s OR lower(name) LIKE %s)")
+        params.extend([prefix, prefix])
+
+    if min_balance is not None:
+        conditions.append("balance >= %s")
+        params.append(min_balance)
+
+    if max_balance is not None:
+        conditions.append("balance <= %s")
+        params.append(max_balance)
+
+    if body.get('is_admin') is not None:
+        conditions.append("is_admin = %s")
+        params.append(bool(body['is_admin']))
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    req.cur.execute(
+        f"SELECT id, email, name, balance, is_admin, created_at FROM users {where} "
+        "ORDER BY created_at DESC, id DESC LIMIT %s",
+        (*params, page_size + 1)
+    )
+    users = req.cur.fetchall()
+
+    has_more = len(users) > page_size
+    users = users[:page_size]
+
+    result = [{
+        'id': u[0],
+        'email': u[1],
+        'name': u[2],
+        'balance': float(u[3]),
+        'is_admin': u[4],
+        'created_at': u[5].isoformat()
+    } for u in users]
+
+    return respond({
+        'users': result,
+        'next_cursor': encode_cursor(users[-1][5], users[-1][0]) if has_more else None
+    })
+
+
+@router.action('export', admin=True, require=('user_id', 'table'))
+def export_rows(req: Request) -> Dict[str, Any]:
+    body = req.body
+    table = body.get('table')
+    fmt = body.get('format', 'csv')
+    try:
+        if table not in export.EXPORTS or fmt not in export.FORMATS:
+            raise ValueError
+        date_from = datetime.fromisoformat(body['date_from']) if body.get('date_from') else None
+        date_to = datetime.fromisoformat(body['date_to']) if body.get('date_to') else None
+        after_id = int(body.get('cursor') or 0)
+        limit = min(max(int(body.get('limit', export.CHUNK_ROWS)), 1), export.MAX_CHUNK_ROWS)
+    except (TypeError, ValueError):
+        return error(400, f"table must be one of {', '.join(export.EXPORTS)}, format one of "
+                          f"{', '.join(export.FORMATS)}; dates ISO 8601, cursor and limit integers")
+
+    chunk = export.export(req.conn, table, fmt, date_from, date_to, after_id, limit)
+
+    return {
+        'statusCode': 200,
+        'headers': dict(
+            JSON_HEADERS,
+            **{
+                'Content-Type': 'application/gzip',
+                'Content-Disposition': f'attachment; filename="{table}-{after_id}.{fmt}.gz"',
+                'X-Export-Rows': str(chunk['rows']),
+                'X-Next-Cursor': '' if chunk['next_cursor'] is None else str(chunk['next_cursor']),
+                'Access-Control-Expose-Headers': 'X-Export-Rows, X-Next-Cursor'
             }
-        
-        cur.close()
-        conn.close()
-    
+        ),
+        'body': base64.b64encode(chunk['data']).decode(),
+        'isBase64Encoded': True
+    }
+
+
+@router.action('list_profiles', admin=True)
+def list_profiles(req: Request) -> Dict[str, Any]:
+    req.cur.execute(
+        "SELECT id, action, user_id, wall_ms, db_ms, octet_length(artifact), created_at "
+        "FROM profile_artifacts ORDER BY id DESC LIMIT %s",
+        (PROFILE_LIST_SIZE,)
+    )
+
+    return respond({'profiles': [
+        {
+            'id': row[0],
+            'action': row[1],
+            'user_id': row[2],
+            'wall_ms': float(row[3]),
+            'db_ms': float(row[4]),
+            'bytes': row[5],
+            'created_at': row[6].isoformat()
+        }
+        for row in req.cur.fetchall()
+    ]})
+
+
+@router.action('get_profile', admin=True, require=('user_id', 'profile_id'), fields={'profile_id': int})
+def get_profile(req: Request) -> Dict[str, Any]:
+    profile_id = req.get('profile_id')
+
+    req.cur.execute("SELECT action, artifact FROM profile_artifacts WHERE id = %s", (profile_id,))
+    row = req.cur.fetchone()
+
+    if not row:
+        return error(404, 'Profile not found')
+
     return {
-        'statusCode': 405,
-        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-        'body': json.dumps({'error': 'Method not allowed'})
+        'statusCode': 200,
+        'headers': dict(
+            JSON_HEADERS,
+            **{
+                'Content-Type': 'application/gzip',
+                'Content-Disposition': f'attachment; filename="profile-{profile_id}-{row[0]}.json.gz"'
+            }
+        ),
+        'body': base64.b64encode(bytes(row[1])).decode(),
+        'isBase64Encoded': True
     }
+
+
+@router.action('update_balance', admin=True, require=('user_id', 'target_user_id', 'new_balance'),
+               fields={'new_balance': NUMBER})
+def update_balance(req: Request) -> Dict[str, Any]:
+    target_user_id = req.get('target_user_id')
+
+    req.cur.execute(
+        "UPDATE users u SET balance = %s FROM (SELECT COALESCE(balance, 0) AS balance FROM users WHERE id = %s FOR UPDATE) old "
+        "WHERE u.id = %s RETURNING u.balance, old.balance, pg_notify('user_profile', concat(u.id, ':', u.balance))",
+        (req.get('new_balance'), target_user_id, target_user_id)
+    )
+    updated_balance = req.cur.fetchone()
+
+    if not updated_balance:
+        return error(404, 'User not found')
+
+    record(
+        req.cur, target_user_id, 'admin', 0, 0, updated_balance[0],
+        reference=f'admin:{req.user_id}', delta=updated_balance[0] - updated_balance[1]
+    )
+    req.commit()
+
+    return respond({'new_balance': float(updated_balance[0])})
+
+
+@router.action('make_admin', admin=True, require=('user_id', 'target_user_id'))
+def make_admin(req: Request) -> Dict[str, Any]:
+    req.cur.execute(
+        "UPDATE users SET is_admin = TRUE WHERE id = %s RETURNING is_admin, pg_notify('user_profile', id::text)",
+        (req.get('target_user_id'),)
+    )
+    result = req.cur.fetchone()
+
+    if not result:
+        return error(404, 'User not found')
+
+    req.commit()
+
+    return respond({'success': True})
+
+
+def parse_prizes(prizes: Any) -> Tuple[list, list]:
+    '''([amounts], [chances]) from [{"amount": ..., "chance": ...}]; raises ValueError.'''
+    if not isinstance(prizes, list) or not 0 < len(prizes) <= MAX_CASE_PRIZES:
+        raise ValueError
+    amounts, chances = [], []
+    for prize in prizes:
+        amount, chance = float(prize['amount']), float(prize['chance'])
+        if not (math.isfinite(amount) and math.isfinite(chance)) or amount < 0 or chance < 0:
+            raise ValueError
+        amounts.append(amount)
+        chances.append(chance)
+    if sum(chances) <= 0:
+        raise ValueError
+    return amounts, chances
+
+
+@router.action('get_cases', admin=True)
+def get_cases(req: Request) -> Dict[str, Any]:
+    req.cur.execute(CASES_SQL)
+    rows = req.cur.fetchall()
+    req.cur.execute("SELECT version FROM case_catalog")
+    version = req.cur.fetchone()[0]
+
+    return respond({
+        'version': version,
+        'cases': [{
+            'id': r[0],
+            'name': r[1],
+            'price': float(r[2]),
+            'active': r[3],
+            'sort_order': r[4],
+            'updated_at': r[5].isoformat(),
+            'prizes': r[6]
+        } for r in rows]
+    })
+
+
+@router.action('save_case', admin=True, require=('user_id', 'case_id', 'name', 'price', 'prizes'),
+               fields={'case_id': str, 'name': str, 'price': NUMBER, 'active': bool, 'sort_order': int})
+def save_case(req: Request) -> Dict[str, Any]:
+    case_id = req.get('case_id')
+    price = req.get('price')
+    try:
+        if not CASE_ID_PATTERN.match(case_id) or price <= 0:
+            raise ValueError
+        amounts, chances = parse_prizes(req.get('prizes'))
+    except (TypeError, ValueError, KeyError):
+        return error(400, f'case_id must match {CASE_ID_PATTERN.pattern}, price be positive and prizes '
+                          f'1-{MAX_CASE_PRIZES} entries of non-negative amount and chance with a positive total')
+
+    # One transaction: the game function never sees a case without its prizes
+    req.cur.execute(UPSERT_CASE_SQL, (case_id, req.get('name'), price, req.get('active', True), req.get('sort_order', 0)))
+    req.cur.execute("DELETE FROM case_prizes WHERE case_id = %s", (case_id,))
+    req.cur.execute(INSERT_PRIZES_SQL, (case_id, amounts, chances))
+    req.cur.execute("SELECT version FROM case_catalog")
+    version = req.cur.fetchone()[0]
+    req.commit()
+
+    return respond({'success': True, 'version': version})
+
+
+@router.action('ping', db=False, require=())
+def ping(req: Request) -> Dict[str, Any]:
+    # Scheduled warm-up: pre-opens the pool so the next player request skips the connect
+    if req.get('warm', True):
+        warm()
+    return respond({'ok': True, 'pool': pool_stats()})
+
+
+@router.action('metrics', db=False, require=())
+def metrics_snapshot(req: Request) -> Dict[str, Any]:
+    return snapshot(req.get('token'), pool_stats())
+
+
+@instrumented(router)
+@profiled(router)
+@releases_connections
+@idempotent(MUTATING_ACTIONS)
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    return router(event, context)
@@ -0,0 +1,53 @@
+'''
+Business: Append-only balance ledger written in the same transaction as every balance change
+Args: open cursor, user id, game, bet, payout and the balance the change produced
+Returns: nothing; rows land in the monthly partition of balance_ledger
+'''
+
+from decimal import Decimal
+from typing import Any, Iterable, List, Optional, Sequence, Tuple
+
+
+INSERT_PREFIX = "INSERT INTO balance_ledger (user_id, game, bet, payout, delta, balance_after, reference) VALUES "
+INSERT_SQL = INSERT_PREFIX + "%s"
+INSERT_ROW_SQL = INSERT_PREFIX + "(%s, %s, %s, %s, %s, %s, %s)"
+BATCH_SIZE = 500
+CENT = Decimal('0.01')
+
+
+def to_money(value: Any) -> Decimal:
+    return value if isinstance(value, Decimal) else Decimal(str(value)).quantize(CENT)
+
+
+def entry(user_id: int, game: str, bet: Any, payout: Any, balance_after: Any,
+          reference: Optional[str] = None, delta: Any = None) -> Tuple:
+    bet, payout = to_money(bet), to_money(payout)
+    delta = payout - bet if delta is None else to_money(delta)
+    return (user_id, game, bet, payout, delta, to_money(balance_after), reference)
+
+
+def round_entries(user_id: int, game: str, rounds: Sequence[Tuple[Any, Any]], balance_after: Any,
+                  reference: Optional[str] = None) -> List[Tuple]:
+    '''One entry per round of a multi-round action settled as a single net change, with running balances.'''
+    rounds = [(to_money(bet), to_money(payout)) for bet, payout in rounds]
+    balance = to_money(balance_after) - sum((payout - bet for bet, payout in rounds), Decimal(0))
+    entries = []
+    for bet, payout in rounds:
+        balance += payout - bet
+        entries.append((user_id, game, bet, payout, payout - bet, balance, reference))
+    return entries
+
+
+def record_many(cur: Any, entries: Iterable[Tuple]) -> None:
+    '''Batched insert; psycopg2.extras (and the logging machinery it pulls in) is imported on first use.'''
+    from psycopg2.extras import execute_values
+
+    execute_values(cur, INSERT_SQL, list(entries), page_size=BATCH_SIZE)
+
+
+def record(cur: Any, user_id: int, game: str, bet: Any, payout: Any, balance_after: Any,
+           reference: Optional[str] = None, delta: Any = None) -> None:
+    cur.execute(
+        INSERT_ROW_SQL,
+        entry(user_id, game, bet, payout, balance_after, reference, delta)
+    )
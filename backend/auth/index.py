@@ -4,139 +4,99 @@ Args: event with httpMethod, body for login/user operations
 Returns: HTTP response with user data or auth status
 '''
 
-import json
-import os
-import psycopg2
-from typing import Dict, Any, Optional
+from typing import Dict, Any
+from db import releases_connections, pool_stats, warm
+from metrics import instrumented, snapshot
+from profiling import profiled
+from router import Router, Request, respond, error
+import profile_cache
 
-def get_db_connection():
-    return psycopg2.connect(os.environ['DATABASE_URL'])
+# One round trip for first and repeat logins; concurrent first logins resolve on the UNIQUE key.
+# Replaying it is harmless, so login is not idempotency-keyed: keys would have no user to scope them to.
+LOGIN_SQL = '''
+INSERT INTO users (google_id, email, name, last_login_at) VALUES (%s, %s, %s, CURRENT_TIMESTAMP)
+ON CONFLICT (google_id) DO UPDATE SET last_login_at = EXCLUDED.last_login_at
+RETURNING id, email, name, balance, is_admin
+'''
 
-def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
-    method: str = event.get('httpMethod', 'GET')
-    
-    if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': ''
+
+router = Router()
+
+
+@router.action('login', require=('phone_number',), fields={'phone_number': str, 'code': str})
+def login(req: Request) -> Dict[str, Any]:
+    phone_number = req.get('phone_number')
+    code = req.get('code', '1234')
+
+    if code != '1234':
+        return error(400, 'Invalid code')
+
+    name = f'User{phone_number[-4:]}'
+    email = f'{phone_number}@phone.user'
+
+    req.cur.execute(LOGIN_SQL, (phone_number, email, name))
+    user = req.cur.fetchone()
+    req.commit()
+
+    result = {
+        'id': user[0],
+        'email': user[1],
+        'name': user[2],
+        'balance': float(user[3]),
+        'is_admin': user[4]
+    }
+
+    profile_cache.put(result)
+
+    return respond(result)
+
+
+@router.action('get_user')
+def get_user(req: Request) -> Dict[str, Any]:
+    profile = profile_cache.get(req.user_id)
+
+    if profile is None:
+        req.cur.execute(
+            "SELECT id, email, name, balance, is_admin FROM users WHERE id = %s",
+            (req.user_id,)
+        )
+        user = req.cur.fetchone()
+
+        if not user:
+            return error(404, 'User not found')
+
+        profile = {
+            'id': user[0],
+            'email': user[1],
+            'name': user[2],
+            'balance': float(user[3]),
+            'is_admin': user[4]
         }
-    
-    if method == 'POST':
-        body = json.loads(event.get('body', '{}'))
-        action = body.get('action')
-        
-        if action == 'login':
-            phone_number = body.get('phone_number')
-            code = body.get('code', '1234')
-            
-            if not phone_number:
-                return {
-                    'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Missing phone_number'})
-                }
-            
-            if code != '1234':
-                return {
-                    'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Invalid code'})
-                }
-            
-            name = f'User{phone_number[-4:]}'
-            email = f'{phone_number}@phone.user'
-            
-            conn = get_db_connection()
-            cur = conn.cursor()
-            
-            cur.execute(
-                "SELECT id, email, name, balance, is_admin FROM users WHERE google_id = %s",
-                (phone_number,)
-            )
-            user = cur.fetchone()
-            
-            if user:
-                result = {
-                    'id': user[0],
-                    'email': user[1],
-                    'name': user[2],
-                    'balance': float(user[3]),
-                    'is_admin': user[4]
-                }
-            else:
-                cur.execute(
-                    "INSERT INTO users (google_id, email, name) VALUES (%s, %s, %s) RETURNING id, email, name, balance, is_admin",
-                    (phone_number, email, name)
-                )
-                new_user = cur.fetchone()
-                conn.commit()
-                
-                result = {
-                    'id': new_user[0],
-                    'email': new_user[1],
-                    'name': new_user[2],
-                    'balance': float(new_user[3]),
-                    'is_admin': new_user[4]
-                }
-            
-            cur.close()
-            conn.close()
-            
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps(result)
-            }
-        
-        if action == 'get_user':
-            user_id = body.get('user_id')
-            
-            if not user_id:
-                return {
-                    'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Missing user_id'})
-                }
-            
-            conn = get_db_connection()
-            cur = conn.cursor()
-            
-            cur.execute(
-                "SELECT id, email, name, balance, is_admin FROM users WHERE id = %s",
-                (user_id,)
-            )
-            user = cur.fetchone()
-            
-            cur.close()
-            conn.close()
-            
-            if not user:
-                return {
-                    'statusCode': 404,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'User not found'})
-                }
-            
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({
-                    'id': user[0],
-                    'email': user[1],
-                    'name': user[2],
-                    'balance': float(user[3]),
-                    'is_admin': user[4]
-                })
-            }
-    
-    return {
-        'statusCode': 405,
-        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-        'body': json.dumps({'error': 'Method not allowed'})
-    }
\ No newline at end of file
+        profile_cache.put(profile)
+
+    return respond(profile)
+
+
+@router.action('cache_stats', db=False, require=())
+def cache_stats(req: Request) -> Dict[str, Any]:
+    return respond({'profiles': profile_cache.cache_stats(), 'pool': pool_stats()})
+
+
+@router.action('ping', db=False, require=())
+def ping(req: Request) -> Dict[str, Any]:
+    # Scheduled warm-up: pre-opens the pool so the next player request skips the connect
+    if req.get('warm', True):
+        warm()
+    return respond({'ok': True, 'pool': pool_stats()})
+
+
+@router.action('metrics', db=False, require=())
+def metrics_snapshot(req: Request) -> Dict[str, Any]:
+    return snapshot(req.get('token'), pool_stats())
+
+
+@instrumented(router)
+@profiled(router)
+@releases_connections
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    return router(event, context)
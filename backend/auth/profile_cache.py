@@ -0,0 +1,158 @@
+'''
+Business: Read-through TTL+LRU cache of user profiles so header balance polls skip the database
+Args: user id to read, profile dict to store; PROFILE_CACHE_TTL / PROFILE_CACHE_SIZE env
+Returns: cached profile dicts, hit/miss/eviction counters
+
+Admin edits commit a NOTIFY on the user_profile channel: "<id>:<balance>" for a
+balance change, plain "<id>" when anything else about the user changed. A dedicated
+LISTEN connection is drained without blocking before each lookup, so those are
+patched in place instead of being refetched. Game functions send plain "<id>"
+evictions for the users a request changed, in one NOTIFY statement after the
+request has committed (settlement.announces_balances), so the per-bet commit never
+waits on the notification queue lock; the next lookup refetches. Profiles are only
+served while the LISTEN connection is healthy; after a reconnect the cache starts
+empty because notifications may have been missed. The TTL bounds staleness if one
+is ever lost.
+'''
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from decimal import Decimal
+from typing import Any, Dict, Optional
+
+import psycopg2
+import psycopg2.extensions
+
+from db import CONNECT_KWARGS
+
+CHANNEL = 'user_profile'
+TTL_SECONDS = float(os.environ.get('PROFILE_CACHE_TTL', '30'))
+CACHE_SIZE = int(os.environ.get('PROFILE_CACHE_SIZE', '10000'))
+LISTEN_RETRY_SECONDS = 5
+
+_profiles: 'OrderedDict[int, tuple]' = OrderedDict()
+_lock = threading.Lock()
+_listener: Optional[psycopg2.extensions.connection] = None
+_listen_retry_at = 0.0
+stats = {
+    'hits': 0,
+    'misses': 0,
+    'evictions': 0,
+    'expirations': 0,
+    'updates': 0,
+    'invalidations': 0,
+    'listener_restarts': 0
+}
+
+
+def _clear() -> None:
+    with _lock:
+        _profiles.clear()
+
+
+def _listen() -> bool:
+    global _listener, _listen_retry_at
+    if _listener is not None and not _listener.closed:
+        return True
+    if time.monotonic() < _listen_retry_at:
+        return False
+    try:
+        conn = psycopg2.connect(os.environ['DATABASE_URL'], **CONNECT_KWARGS)
+        conn.autocommit = True
+        cur = conn.cursor()
+        cur.execute(f'LISTEN {CHANNEL}')
+        cur.close()
+    except psycopg2.Error:
+        _listen_retry_at = time.monotonic() + LISTEN_RETRY_SECONDS
+        return False
+    _listener = conn
+    stats['listener_restarts'] += 1
+    _clear()
+    return True
+
+
+def _apply(payload: str) -> None:
+    user_id, _, balance = payload.partition(':')
+    try:
+        user_id = int(user_id)
+    except ValueError:
+        return
+    with _lock:
+        cached = _profiles.get(user_id)
+        if cached is None:
+            return
+        if balance:
+            cached[1]['balance'] = float(Decimal(balance))
+            stats['updates'] += 1
+        else:
+            del _profiles[user_id]
+            stats['invalidations'] += 1
+
+
+def drain() -> bool:
+    '''Applies pending notifications; False when the listener is down and the cache must not be trusted.'''
+    global _listener
+    if not _listen():
+        _clear()
+        return False
+    try:
+        _listener.poll()
+    except psycopg2.Error:
+        try:
+            _listener.close()
+        except psycopg2.Error:
+            pass
+        _listener = None
+        _clear()
+        return False
+    while _listener.notifies:
+        _apply(_listener.notifies.pop(0).payload)
+    return True
+
+
+def get(user_id: Any) -> Optional[Dict[str, Any]]:
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        return None
+    if not drain():
+        stats['misses'] += 1
+        return None
+    with _lock:
+        cached = _profiles.get(user_id)
+        if cached is not None and cached[0] <= time.monotonic():
+            del _profiles[user_id]
+            stats['expirations'] += 1
+            cached = None
+        if cached is None:
+            stats['misses'] += 1
+            return None
+        _profiles.move_to_end(user_id)
+        stats['hits'] += 1
+        return dict(cached[1])
+
+
+def put(profile: Dict[str, Any]) -> None:
+    if _listener is None or _listener.closed:
+        return
+    with _lock:
+        _profiles[profile['id']] = (time.monotonic() + TTL_SECONDS, dict(profile))
+        _profiles.move_to_end(profile['id'])
+        while len(_profiles) > CACHE_SIZE:
+            _profiles.popitem(last=False)
+            stats['evictions'] += 1
+
+
+def cache_stats() -> Dict[str, Any]:
+    with _lock:
+        size = len(_profiles)
+    lookups = stats['hits'] + stats['misses']
+    return {
+        'size': size,
+        'max': CACHE_SIZE,
+        'hit_ratio': round(stats['hits'] / lookups, 4) if lookups else 0.0,
+        'listening': _listener is not None and not _listener.closed,
+        **stats
+    }
@@ -0,0 +1,229 @@
+'''
+Business: Case catalog and O(1) prize sampling via Walker/Vose alias tables
+Args: open cursor (for catalog version checks), case_id and number of draws
+Returns: prize amounts drawn with the normalized case odds
+
+The live catalog is the cases/case_prizes tables (migration V0014), edited through
+the admin function. catalog() keeps a compiled copy - alias tables and the public
+listing - and checks case_catalog.version on the caller's cursor at most once per
+CASE_CATALOG_CHECK_SECONDS, reloading only when the version moved. Between checks
+opening a case costs no catalog query. CASES below is the seed catalog, also used
+by the offline RTP simulator; its alias tables (seed_tables) are only built when
+first asked for, so importing the module for the game function builds none.
+'''
+
+import json
+import os
+import random
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+CATALOG_CHECK_SECONDS = float(os.environ.get('CASE_CATALOG_CHECK_SECONDS', '5'))
+
+VERSION_SQL = "SELECT version FROM case_catalog"
+
+CATALOG_SQL = '''
+SELECT c.id, c.name, c.price, p.amount, p.chance
+FROM cases c JOIN case_prizes p ON p.case_id = c.id
+WHERE c.active
+ORDER BY c.sort_order, c.id, p.id
+'''
+
+CASES = {
+    'bomj': {
+        'name': 'Бомж',
+        'price': 30.00,
+        'prizes': [
+            {'amount': 100, 'chance': 50},
+            {'amount': 200, 'chance': 24},
+            {'amount': 250, 'chance': 23},
+            {'amount': 300, 'chance': 20}
+        ]
+    },
+    'rich': {
+        'name': 'Богатый',
+        'price': 560.00,
+        'prizes': [
+            {'amount': 350, 'chance': 75},
+            {'amount': 400, 'chance': 50},
+            {'amount': 1200, 'chance': 11},
+            {'amount': 3000, 'chance': 10},
+            {'amount': 15000, 'chance': 0.0001}
+        ]
+    }
+}
+
+VECTORIZE_THRESHOLD = 1000
+
+
+class AliasTable:
+    '''Vose alias table: one uniform draw and one comparison per sample regardless of prize count.'''
+
+    __slots__ = ('amounts', 'probabilities', 'prob', 'alias', 'size', '_np')
+
+    def __init__(self, amounts: List[float], weights: List[float]):
+        if not amounts or len(amounts) != len(weights):
+            raise ValueError('amounts and weights must be non-empty and of equal length')
+        total = float(sum(weights))
+        if total <= 0 or any(w < 0 for w in weights):
+            raise ValueError('weights must be non-negative with a positive sum')
+
+        size = len(weights)
+        self.amounts = [float(a) for a in amounts]
+        self.probabilities = [w / total for w in weights]
+        self.size = size
+        self.prob = [0.0] * size
+        self.alias = list(range(size))
+        self._np = None
+
+        scaled = [p * size for p in self.probabilities]
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+
+        while small and large:
+            s = small.pop()
+            l = large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] = (scaled[l] + scaled[s]) - 1.0
+            (small if scaled[l] < 1.0 else large).append(l)
+
+        for i in large + small:
+            self.prob[i] = 1.0
+
+    def draw_index(self, rand: float) -> int:
+        scaled = rand * self.size
+        column = int(scaled)
+        return column if scaled - column < self.prob[column] else self.alias[column]
+
+    def draw(self, rng: random.Random = random) -> float:
+        return self.amounts[self.draw_index(rng.random())]
+
+    def draw_many(self, n: int, rng: random.Random = random) -> List[float]:
+        amounts = self.amounts
+        draw_index = self.draw_index
+        rand = rng.random
+        return [amounts[draw_index(rand())] for _ in range(n)]
+
+    def draw_indices_array(self, n: int, rng: Optional[Any] = None) -> Any:
+        '''Vectorized draw of n prize indices as a NumPy array (NumPy imported on first use).'''
+        import numpy as np
+
+        if self._np is None:
+            self._np = (np.asarray(self.prob), np.asarray(self.alias), np.asarray(self.amounts))
+        prob, alias, _ = self._np
+        rng = rng if rng is not None else np.random.default_rng()
+        columns = rng.integers(0, self.size, size=n)
+        accept = rng.random(n) < prob[columns]
+        return np.where(accept, columns, alias[columns])
+
+    def draw_array(self, n: int, rng: Optional[Any] = None) -> Any:
+        indices = self.draw_indices_array(n, rng)
+        return self._np[2][indices]
+
+    def expected_value(self) -> float:
+        return sum(a * p for a, p in zip(self.amounts, self.probabilities))
+
+
+def build_tables(cases: Dict[str, Dict[str, Any]]) -> Dict[str, AliasTable]:
+    return {
+        case_id: AliasTable(
+            [prize['amount'] for prize in case_data['prizes']],
+            [prize['chance'] for prize in case_data['prizes']]
+        )
+        for case_id, case_data in cases.items()
+    }
+
+
+_seed_tables: Optional[Dict[str, AliasTable]] = None
+
+
+def seed_tables() -> Dict[str, AliasTable]:
+    '''Alias tables of the seed CASES, built on first use.'''
+    global _seed_tables
+    if _seed_tables is None:
+        _seed_tables = build_tables(CASES)
+    return _seed_tables
+
+
+def draw(table: AliasTable, n: int) -> List[float]:
+    if n >= VECTORIZE_THRESHOLD:
+        try:
+            return table.draw_array(n).tolist()
+        except ImportError:
+            pass
+    return table.draw_many(n)
+
+
+def sample(case_id: str, n: int = 1) -> List[float]:
+    return draw(seed_tables()[case_id], n)
+
+
+def probabilities(case_id: str) -> List[Dict[str, float]]:
+    table = seed_tables()[case_id]
+    return [
+        {'amount': amount, 'probability': probability}
+        for amount, probability in zip(table.amounts, table.probabilities)
+    ]
+
+
+class Catalog:
+    '''One version of the case catalog, compiled once: alias tables and the serialized public listing.'''
+
+    __slots__ = ('version', 'cases', 'tables', 'listing')
+
+    def __init__(self, version: int, cases: Dict[str, Dict[str, Any]]):
+        self.version = version
+        self.cases = cases
+        self.tables = build_tables(cases)
+        self.listing = json.dumps({'version': version, 'cases': [
+            {
+                'id': case_id,
+                'name': case_data['name'],
+                'price': case_data['price'],
+                'prizes': [
+                    {'amount': amount, 'probability': probability}
+                    for amount, probability in zip(self.tables[case_id].amounts, self.tables[case_id].probabilities)
+                ]
+            }
+            for case_id, case_data in cases.items()
+        ]})
+
+    def sample(self, case_id: str, n: int = 1) -> List[float]:
+        return draw(self.tables[case_id], n)
+
+
+def load(cur: Any, version: int) -> Catalog:
+    cur.execute(CATALOG_SQL)
+    cases: Dict[str, Dict[str, Any]] = {}
+    for case_id, name, price, amount, chance in cur.fetchall():
+        case_data = cases.setdefault(case_id, {'name': name, 'price': float(price), 'prizes': []})
+        case_data['prizes'].append({'amount': float(amount), 'chance': float(chance)})
+    # A case whose chances are all zero cannot be drawn from; leave it out rather than fail every request
+    return Catalog(version, {
+        case_id: case_data for case_id, case_data in cases.items()
+        if sum(prize['chance'] for prize in case_data['prizes']) > 0
+    })
+
+
+_catalog: Optional[Catalog] = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def catalog(cur: Any) -> Catalog:
+    '''The compiled catalog, re-validated against case_catalog.version at most every CATALOG_CHECK_SECONDS.'''
+    global _catalog, _checked_at
+    current = _catalog
+    if current is not None and time.monotonic() - _checked_at < CATALOG_CHECK_SECONDS:
+        return current
+    with _lock:
+        if _catalog is not None and time.monotonic() - _checked_at < CATALOG_CHECK_SECONDS:
+            return _catalog
+        cur.execute(VERSION_SQL)
+        version = cur.fetchone()[0]
+        if _catalog is None or _catalog.version != version:
+            _catalog = load(cur, version)
+        _checked_at = time.monotonic()
+        return _catalog
@@ -4,196 +4,185 @@ Args: event with httpMethod, body for game actions
 Returns: HTTP response with game results
 '''
 
-import json
-import os
-import psycopg2
-from typing import Dict, Any
-import random
-
-def get_db_connection():
-    return psycopg2.connect(os.environ['DATABASE_URL'])
-
-CASES = {
-    'bomj': {
-        'name': 'Бомж',
-        'price': 30.00,
-        'prizes': [
-            {'amount': 100, 'chance': 50},
-            {'amount': 200, 'chance': 24},
-            {'amount': 250, 'chance': 23},
-            {'amount': 300, 'chance': 20}
-        ]
-    },
-    'rich': {
-        'name': 'Богатый',
-        'price': 560.00,
-        'prizes': [
-            {'amount': 350, 'chance': 75},
-            {'amount': 400, 'chance': 50},
-            {'amount': 1200, 'chance': 11},
-            {'amount': 3000, 'chance': 10},
-            {'amount': 15000, 'chance': 0.0001}
-        ]
-    }
+import base64
+from datetime import datetime
+from typing import Dict, Any, Tuple
+from db import releases_connections, pool_stats, warm
+from idempotency import idempotent
+from metrics import instrumented, snapshot
+from profiling import profiled
+from ratelimit import rate_limited
+from router import Router, Request, respond, respond_raw, error
+import cases
+from ledger import record_many, round_entries
+import promo
+import leaderboard
+from settlement import announces_balances, balance_changed, settle
+
+MAX_CASES_PER_OPEN = 100
+HISTORY_PAGE_SIZE = 20
+MAX_HISTORY_PAGE_SIZE = 100
+
+HISTORY_SQL = '''
+SELECT id, case_name, case_price, prize_amount, opened_at FROM case_openings
+WHERE user_id = %s AND (opened_at, id) < (%s, %s)
+ORDER BY opened_at DESC, id DESC
+LIMIT %s
+'''
+
+MUTATING_ACTIONS = ('use_promo', 'open_case')
+
+# (tokens per second, burst) per user; RATE_LIMITS env overrides, e.g. "coinflip=2/5"
+RATE_LIMITS = {
+    'open_case': (5, 10),
+    'use_promo': (1, 3),
+    'get_history': (5, 10)
 }
 
-def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
-    method: str = event.get('httpMethod', 'GET')
-    
-    if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': ''
-        }
-    
-    if method == 'POST':
-        body = json.loads(event.get('body', '{}'))
-        action = body.get('action')
-        user_id = body.get('user_id')
-        
-        if not user_id:
-            return {
-                'statusCode': 400,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Missing user_id'})
-            }
-        
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        if action == 'use_promo':
-            promo_code = body.get('promo_code')
-            
-            if not promo_code:
-                cur.close()
-                conn.close()
-                return {
-                    'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Missing promo_code'})
-                }
-            
-            cur.execute("SELECT id, amount, max_uses, current_uses FROM promo_codes WHERE code = %s", (promo_code,))
-            promo = cur.fetchone()
-            
-            if not promo:
-                cur.close()
-                conn.close()
-                return {
-                    'statusCode': 404,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Promo code not found'})
-                }
-            
-            promo_id, amount, max_uses, current_uses = promo
-            
-            cur.execute("SELECT COUNT(*) FROM user_promo_usage WHERE user_id = %s AND promo_code_id = %s", (user_id, promo_id))
-            user_uses = cur.fetchone()[0]
-            
-            if current_uses >= max_uses:
-                cur.close()
-                conn.close()
-                return {
-                    'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Promo code limit reached'})
-                }
-            
-            if user_uses > 0:
-                cur.close()
-                conn.close()
-                return {
-                    'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Already used this promo'})
-                }
-            
-            cur.execute("INSERT INTO user_promo_usage (user_id, promo_code_id) VALUES (%s, %s)", (user_id, promo_id))
-            cur.execute("UPDATE promo_codes SET current_uses = current_uses + 1 WHERE id = %s", (promo_id,))
-            cur.execute("UPDATE users SET balance = balance + %s WHERE id = %s RETURNING balance", (amount, user_id))
-            new_balance = cur.fetchone()[0]
-            conn.commit()
-            
-            cur.close()
-            conn.close()
-            
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'amount': float(amount), 'new_balance': float(new_balance)})
-            }
-        
-        if action == 'open_case':
-            case_id = body.get('case_id')
-            
-            if not case_id or case_id not in CASES:
-                cur.close()
-                conn.close()
-                return {
-                    'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Invalid case_id'})
-                }
-            
-            case_data = CASES[case_id]
-            
-            cur.execute("SELECT balance FROM users WHERE id = %s", (user_id,))
-            user_balance = cur.fetchone()
-            
-            if not user_balance or user_balance[0] < case_data['price']:
-                cur.close()
-                conn.close()
-                return {
-                    'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Insufficient balance'})
-                }
-            
-            rand = random.random() * 100
-            cumulative = 0
-            won_amount = case_data['prizes'][0]['amount']
-            
-            for prize in case_data['prizes']:
-                cumulative += prize['chance']
-                if rand <= cumulative:
-                    won_amount = prize['amount']
-                    break
-            
-            cur.execute(
-                "UPDATE users SET balance = balance - %s + %s WHERE id = %s RETURNING balance",
-                (case_data['price'], won_amount, user_id)
-            )
-            new_balance = cur.fetchone()[0]
-            
-            cur.execute(
-                "INSERT INTO case_openings (user_id, case_name, case_price, prize_amount) VALUES (%s, %s, %s, %s)",
-                (user_id, case_data['name'], case_data['price'], won_amount)
-            )
-            
-            conn.commit()
-            cur.close()
-            conn.close()
-            
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({
-                    'won_amount': float(won_amount),
-                    'new_balance': float(new_balance)
-                })
+def encode_cursor(opened_at: datetime, row_id: int) -> str:
+    return base64.urlsafe_b64encode(f'{opened_at.isoformat()}|{row_id}'.encode()).decode()
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    opened_at, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+    return datetime.fromisoformat(opened_at), int(row_id)
+
+
+router = Router()
+
+
+@router.action('leaderboard', require=(), fields={'limit': int})
+def get_leaderboard(req: Request) -> Dict[str, Any]:
+    board = req.get('board', 'wins')
+    period = req.get('period', 'day')
+    limit = min(max(req.get('limit', leaderboard.DEFAULT_LIMIT), 1), leaderboard.MAX_LIMIT)
+
+    if board not in leaderboard.BOARDS or period not in leaderboard.PERIODS:
+        return error(400, f"board must be one of {', '.join(leaderboard.BOARDS)}, "
+                          f"period one of {', '.join(leaderboard.PERIODS)}")
+
+    leaders = leaderboard.cached(board, period, limit)
+    if leaders is None:
+        leaders = leaderboard.load(req.cur, board, period, limit)
+
+    return respond_raw(leaders)
+
+
+@router.action('use_promo', require=('user_id', 'promo_code'), fields={'promo_code': str})
+def use_promo(req: Request) -> Dict[str, Any]:
+    redemption = promo.redeem(req.cur, req.user_id, req.get('promo_code'))
+
+    if redemption['outcome'] != 'ok':
+        req.rollback()
+        status, message = promo.ERRORS[redemption['outcome']]
+        return respond({'error': message, 'code': redemption['outcome']}, status)
+
+    req.commit()
+    balance_changed((req.user_id,))
+
+    return respond({
+        'amount': float(redemption['amount']),
+        'new_balance': float(redemption['new_balance'])
+    })
+
+
+@router.action('list_cases', require=())
+def list_cases(req: Request) -> Dict[str, Any]:
+    # Served from the compiled catalog; the lazy cursor only connects when the version check is due
+    return respond_raw(cases.catalog(req.lazy_cur).listing)
+
+
+@router.action('open_case', fields={'count': int})
+def open_case(req: Request) -> Dict[str, Any]:
+    case_id = req.get('case_id')
+    count = req.get('count', 1)
+    user_id = req.user_id
+
+    if count < 1 or count > MAX_CASES_PER_OPEN:
+        return error(400, f'count must be between 1 and {MAX_CASES_PER_OPEN}')
+
+    catalog = cases.catalog(req.cur)
+
+    if not case_id or case_id not in catalog.cases:
+        return error(400, 'Invalid case_id')
+
+    case_data = catalog.cases[case_id]
+    total_price = case_data['price'] * count
+
+    prizes = catalog.sample(case_id, count)
+    total_won = sum(prizes)
+
+    new_balance = settle(req.cur, user_id, f'case:{case_id}', total_price, total_won, ledger=False)
+
+    if new_balance is None:
+        return error(400, 'Insufficient balance')
+
+    from psycopg2.extras import execute_values
+
+    execute_values(
+        req.cur,
+        "INSERT INTO case_openings (user_id, case_name, case_price, prize_amount) VALUES %s",
+        [(user_id, case_data['name'], case_data['price'], prize) for prize in prizes],
+        page_size=MAX_CASES_PER_OPEN
+    )
+    record_many(req.cur, round_entries(
+        user_id, f'case:{case_id}', [(case_data['price'], prize) for prize in prizes], new_balance
+    ))
+
+    req.commit()
+
+    return respond({
+        'won_amount': float(total_won),
+        'new_balance': float(new_balance),
+        'results': [{'won_amount': float(prize)} for prize in prizes]
+    })
+
+
+@router.action('get_history', fields={'limit': int, 'cursor': str})
+def get_history(req: Request) -> Dict[str, Any]:
+    page_size = min(max(req.get('limit', HISTORY_PAGE_SIZE), 1), MAX_HISTORY_PAGE_SIZE)
+    try:
+        after = decode_cursor(req.get('cursor')) if req.get('cursor') else (datetime.max, 0)
+    except ValueError:
+        return error(400, 'Invalid cursor')
+
+    req.cur.execute(HISTORY_SQL, (req.user_id, after[0], after[1], page_size + 1))
+    openings = req.cur.fetchall()
+    has_more = len(openings) > page_size
+    openings = openings[:page_size]
+
+    return respond({
+        'openings': [
+            {
+                'id': row[0],
+                'case_name': row[1],
+                'case_price': float(row[2]),
+                'won_amount': float(row[3]),
+                'opened_at': row[4].isoformat()
             }
-    
-    cur.close()
-    conn.close()
-    
-    return {
-        'statusCode': 405,
-        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-        'body': json.dumps({'error': 'Method not allowed'})
-    }
+            for row in openings
+        ],
+        'next_cursor': encode_cursor(openings[-1][4], openings[-1][0]) if has_more else None
+    })
+
+
+@router.action('ping', db=False, require=())
+def ping(req: Request) -> Dict[str, Any]:
+    # Scheduled warm-up: pre-opens the pool so the next player request skips the connect
+    if req.get('warm', True):
+        warm()
+    return respond({'ok': True, 'pool': pool_stats()})
+
+
+@router.action('metrics', db=False, require=())
+def metrics_snapshot(req: Request) -> Dict[str, Any]:
+    return snapshot(req.get('token'), pool_stats())
+
+
+@instrumented(router)
+@profiled(router)
+@releases_connections
+@announces_balances
+@rate_limited(RATE_LIMITS)
+@idempotent(MUTATING_ACTIONS)
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    return router(event, context)
@@ -0,0 +1,71 @@
+'''
+Business: Public leaderboards - biggest single wins and top net winners for today or the last 7 days
+Args: open cursor (only on a cache miss), board ('wins' | 'net'), period ('day' | 'week'), row limit
+Returns: ranked rows from the leaderboard_daily rollup, served from a short-TTL in-process cache
+
+leaderboard_daily (migrations V0012, V0016) is kept current by a trigger on balance_ledger,
+so a miss reads at most 7 days of per-user rollup rows. Hits return the already
+serialized body without touching the database.
+'''
+
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+TTL_SECONDS = float(os.environ.get('LEADERBOARD_TTL', '10'))
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+BOARDS = ('wins', 'net')
+PERIODS = {'day': 1, 'week': 7}
+
+WINS_SQL = '''
+SELECT l.user_id, u.name, l.biggest_win, l.biggest_win_game, l.day
+FROM leaderboard_daily l JOIN users u ON u.id = l.user_id
+WHERE l.day > CURRENT_DATE - %s AND l.biggest_win > 0
+ORDER BY l.biggest_win DESC, l.day DESC
+LIMIT %s
+'''
+
+NET_SQL = '''
+SELECT l.user_id, u.name, SUM(l.net) AS net, SUM(l.wagered), SUM(l.rounds)
+FROM leaderboard_daily l JOIN users u ON u.id = l.user_id
+WHERE l.day > CURRENT_DATE - %s
+GROUP BY l.user_id, u.name
+HAVING SUM(l.net) > 0
+ORDER BY net DESC
+LIMIT %s
+'''
+
+_cache: Dict[tuple, tuple] = {}
+_lock = threading.Lock()
+
+
+def cached(board: str, period: str, limit: int) -> Optional[str]:
+    with _lock:
+        hit = _cache.get((board, period, limit))
+    if hit is not None and hit[0] > time.monotonic():
+        return hit[1]
+    return None
+
+
+def load(cur: Any, board: str, period: str, limit: int) -> str:
+    '''Reads the board from the rollup and caches its JSON body.'''
+    days = PERIODS[period]
+    if board == 'wins':
+        cur.execute(WINS_SQL, (days, limit))
+        rows = [
+            {'user_id': r[0], 'name': r[1], 'won_amount': float(r[2]), 'game': r[3], 'day': r[4].isoformat()}
+            for r in cur.fetchall()
+        ]
+    else:
+        cur.execute(NET_SQL, (days, limit))
+        rows = [
+            {'user_id': r[0], 'name': r[1], 'net': float(r[2]), 'wagered': float(r[3]), 'rounds': int(r[4])}
+            for r in cur.fetchall()
+        ]
+    body = json.dumps({'board': board, 'period': period, 'leaders': rows})
+    with _lock:
+        _cache[(board, period, limit)] = (time.monotonic() + TTL_SECONDS, body)
+    return body
@@ -0,0 +1,228 @@
+'''
+Business: In-process latency histograms and counters for handlers, pool checkouts and queries
+Args: handler wrapped with @instrumented(router); METRICS_SAMPLE_RATE, METRICS_LOG, METRICS_TOKEN env
+Returns: the handler's response; the metrics action serves a Prometheus text snapshot
+
+Every request records its handler wall time and status per action; that costs two
+clock reads and a bucket increment. Per-query timing and row counts are only taken
+for a METRICS_SAMPLE_RATE fraction of requests, whose cursors are wrapped in a
+TracedCursor. With METRICS_LOG=1 each sampled request, and every 5xx or exception,
+is also written to stdout as one JSON line. Updates are not locked: an increment
+lost to a concurrent thread is an acceptable error for metrics.
+'''
+
+import json
+import os
+import random
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+SAMPLE_RATE = float(os.environ.get('METRICS_SAMPLE_RATE', '0.05'))
+LOG_REQUESTS = os.environ.get('METRICS_LOG', '') in ('1', 'true')
+TOKEN = os.environ.get('METRICS_TOKEN', '')
+SQL_PREVIEW_LENGTH = 80
+
+# Upper bounds in seconds; the last bucket is +Inf
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROW_BUCKETS = (0, 1, 5, 10, 50, 100, 500, 1000, 5000, 50000)
+
+TEXT_HEADERS = {'Content-Type': 'text/plain; version=0.0.4', 'Access-Control-Allow-Origin': '*'}
+
+HELP = {
+    'handler_seconds': 'Handler wall time per action',
+    'db_acquire_seconds': 'Time to check a connection out of the pool, per action',
+    'db_connect_seconds': 'Time to open a new PostgreSQL connection',
+    'db_query_seconds': 'Query time per action (sampled requests)',
+    'db_query_rows': 'Rows returned or affected per query (sampled requests)',
+    'db_queries_per_request': 'Queries per request (sampled requests)',
+    'responses_total': 'Responses per action and status code',
+    'handler_exceptions_total': 'Unhandled exceptions per action'
+}
+
+
+class Histogram:
+    __slots__ = ('bounds', 'counts', 'sum')
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+
+_histograms: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], Histogram] = {}
+_counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+_state = threading.local()
+
+
+def observe(name: str, value: float, bounds: Tuple[float, ...] = LATENCY_BUCKETS, **labels: str) -> None:
+    key = (name, tuple(labels.items()))
+    histogram = _histograms.get(key)
+    if histogram is None:
+        histogram = _histograms[key] = Histogram(bounds)
+    histogram.observe(value)
+
+
+def inc(name: str, amount: float = 1, **labels: str) -> None:
+    key = (name, tuple(labels.items()))
+    _counters[key] = _counters.get(key, 0) + amount
+
+
+def current_action() -> str:
+    return getattr(_state, 'action', None) or '-'
+
+
+def observe_acquire(seconds: float) -> None:
+    observe('db_acquire_seconds', seconds, action=current_action())
+
+
+class TracedCursor:
+    '''Cursor proxy that times execute()/executemany() and records the row count for the current request.'''
+
+    __slots__ = ('_cur', '_queries', '_captured')
+
+    def __init__(self, cur: Any, queries: List[Dict[str, Any]], captured: Optional[List[Dict[str, Any]]] = None):
+        self._cur = cur
+        self._queries = queries
+        self._captured = captured
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._cur, name)
+
+    def __iter__(self) -> Any:
+        return iter(self._cur)
+
+    def _timed(self, method: Callable, sql: Any, args: Any) -> Any:
+        started = time.perf_counter()
+        try:
+            return method(sql, args)
+        finally:
+            elapsed = time.perf_counter() - started
+            rows = max(self._cur.rowcount or 0, 0)
+            action = current_action()
+            observe('db_query_seconds', elapsed, action=action)
+            observe('db_query_rows', rows, ROW_BUCKETS, action=action)
+            self._queries.append({
+                'sql': ' '.join(str(sql).split())[:SQL_PREVIEW_LENGTH],
+                'ms': round(elapsed * 1000, 3),
+                'rows': rows
+            })
+            if self._captured is not None:
+                self._captured.append({'sql': sql, 'args': args, 'ms': round(elapsed * 1000, 3), 'rows': rows})
+
+    def execute(self, sql: Any, args: Any = None) -> Any:
+        return self._timed(self._cur.execute, sql, args)
+
+    def executemany(self, sql: Any, args: Any) -> Any:
+        return self._timed(self._cur.executemany, sql, args)
+
+
+def traced(cur: Any) -> Any:
+    '''The cursor itself, or a TracedCursor when the current request is sampled.'''
+    queries = getattr(_state, 'queries', None)
+    return cur if queries is None else TracedCursor(cur, queries, getattr(_state, 'captured', None))
+
+
+def capture_queries() -> List[Dict[str, Any]]:
+    '''Traces every query of the current request and keeps its full SQL and parameters (for profiling).'''
+    if getattr(_state, 'queries', None) is None:
+        _state.queries = []
+    _state.captured = []
+    return _state.captured
+
+
+def _log(action: str, status: Any, elapsed: float, queries: Optional[List[Dict[str, Any]]], failure: str) -> None:
+    line = {'metric': 'request', 'action': action, 'status': status, 'ms': round(elapsed * 1000, 3)}
+    if queries is not None:
+        line['queries'] = queries
+        line['db_ms'] = round(sum(q['ms'] for q in queries), 3)
+    if failure:
+        line['error'] = failure
+    print(json.dumps(line), flush=True)
+
+
+def instrumented(router: Any) -> Callable:
+    '''Handler decorator: times the handler and labels its metrics with the router's action name.'''
+    def decorate(fn: Callable[..., Dict[str, Any]]) -> Callable[..., Dict[str, Any]]:
+        @wraps(fn)
+        def wrapper(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+            sampled = SAMPLE_RATE > 0 and random.random() < SAMPLE_RATE
+            queries = [] if sampled else None
+            action = router.action_name(event)
+            _state.queries = queries
+            _state.captured = None
+            _state.action = action
+            status: Any = 500
+            failure = ''
+            started = time.perf_counter()
+            try:
+                response = fn(event, context)
+                status = response.get('statusCode', 200)
+                return response
+            except Exception as e:
+                failure = type(e).__name__
+                raise
+            finally:
+                elapsed = time.perf_counter() - started
+                _state.queries = None
+                _state.captured = None
+                _state.action = None
+                observe('handler_seconds', elapsed, action=action)
+                inc('responses_total', action=action, status=str(status))
+                if failure:
+                    inc('handler_exceptions_total', action=action)
+                if queries is not None:
+                    observe('db_queries_per_request', len(queries), ROW_BUCKETS, action=action)
+                if LOG_REQUESTS and (sampled or failure or status >= 500):
+                    _log(action, status, elapsed, queries, failure)
+        return wrapper
+    return decorate
+
+
+def _labels(labels: Tuple[Tuple[str, str], ...], extra: str = '') -> str:
+    parts = [f'{name}="{value}"' for name, value in labels]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def exposition(gauges: Optional[Dict[str, float]] = None) -> str:
+    '''Prometheus text format for every histogram and counter, plus `gauges` as pool_* gauges.'''
+    lines: List[str] = []
+    typed = set()
+    for (name, labels), histogram in sorted(_histograms.items(), key=lambda item: item[0]):
+        if name not in typed:
+            typed.add(name)
+            lines.append(f'# HELP {name} {HELP.get(name, name)}')
+            lines.append(f'# TYPE {name} histogram')
+        cumulative = 0
+        for bound, count in zip(histogram.bounds + (float('inf'),), histogram.counts):
+            cumulative += count
+            le_label = 'le="%s"' % ('+Inf' if bound == float('inf') else repr(bound))
+            lines.append(f'{name}_bucket{_labels(labels, le_label)} {cumulative}')
+        lines.append(f'{name}_sum{_labels(labels)} {histogram.sum}')
+        lines.append(f'{name}_count{_labels(labels)} {cumulative}')
+    for (name, labels), value in sorted(_counters.items()):
+        if name not in typed:
+            typed.add(name)
+            lines.append(f'# HELP {name} {HELP.get(name, name)}')
+            lines.append(f'# TYPE {name} counter')
+        lines.append(f'{name}{_labels(labels)} {value}')
+    for name, value in sorted((gauges or {}).items()):
+        lines.append(f'# TYPE pool_{name} gauge')
+        lines.append(f'pool_{name} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+def snapshot(token: Optional[str], gauges: Optional[Dict[str, float]] = None) -> Dict[str, Any]:
+    '''Response for the metrics action; 403 unless METRICS_TOKEN is set and `token` matches it.'''
+    # Pool gauges and per-action traffic are not public: with no token configured the action stays closed
+    if not TOKEN or token != TOKEN:
+        return {'statusCode': 403, 'headers': dict(TEXT_HEADERS), 'body': 'Access denied\n'}
+    return {'statusCode': 200, 'headers': TEXT_HEADERS, 'body': exposition(gauges)}
@@ -0,0 +1,73 @@
+'''
+Business: Promo code redemption in one conditional statement, safe under concurrent bursts
+Args: open cursor, user id and promo code
+Returns: outcome code ('ok', 'not_found', 'user_not_found', 'limit_reached', 'already_used') with amount and new balance
+
+The claim is an UPDATE ... WHERE current_uses < max_uses, so the promo row lock
+serializes concurrent redeemers and the limit is re-checked on the latest row
+version. The usage insert, balance credit and ledger row ride in the same
+statement. When the same user races themselves, the loser's usage insert hits
+the UNIQUE key, nothing is credited, and the caller rolls back the claim.
+'''
+
+from typing import Any, Dict
+
+REDEEM_SQL = '''
+WITH promo AS (
+    SELECT id FROM promo_codes WHERE code = %(code)s
+), claimed AS (
+    UPDATE promo_codes p SET current_uses = p.current_uses + 1
+    FROM promo
+    WHERE p.id = promo.id
+      AND p.current_uses < p.max_uses
+      AND EXISTS (SELECT 1 FROM users WHERE id = %(user_id)s)
+      AND NOT EXISTS (
+          SELECT 1 FROM user_promo_usage u WHERE u.user_id = %(user_id)s AND u.promo_code_id = p.id
+      )
+    RETURNING p.id, p.amount
+), used AS (
+    INSERT INTO user_promo_usage (user_id, promo_code_id)
+    SELECT %(user_id)s, id FROM claimed
+    ON CONFLICT (user_id, promo_code_id) DO NOTHING
+    RETURNING promo_code_id
+), credited AS (
+    UPDATE users SET balance = balance + claimed.amount
+    FROM claimed JOIN used ON used.promo_code_id = claimed.id
+    WHERE users.id = %(user_id)s
+    RETURNING users.balance, claimed.amount
+), ledger AS (
+    INSERT INTO balance_ledger (user_id, game, bet, payout, delta, balance_after, reference)
+    SELECT %(user_id)s, 'promo', 0, amount, amount, balance, %(code)s FROM credited
+)
+SELECT
+    (SELECT id FROM promo),
+    EXISTS (SELECT 1 FROM claimed),
+    (SELECT balance FROM credited),
+    (SELECT amount FROM credited),
+    EXISTS (
+        SELECT 1 FROM user_promo_usage u JOIN promo ON u.promo_code_id = promo.id WHERE u.user_id = %(user_id)s
+    ),
+    EXISTS (SELECT 1 FROM users WHERE id = %(user_id)s)
+'''
+
+ERRORS = {
+    'not_found': (404, 'Promo code not found'),
+    'user_not_found': (404, 'User not found'),
+    'limit_reached': (400, 'Promo code limit reached'),
+    'already_used': (400, 'Already used this promo')
+}
+
+
+def redeem(cur: Any, user_id: int, code: str) -> Dict[str, Any]:
+    cur.execute(REDEEM_SQL, {'user_id': user_id, 'code': code})
+    promo_id, claimed, new_balance, amount, used_before, user_exists = cur.fetchone()
+
+    if promo_id is None:
+        return {'outcome': 'not_found'}
+    if not user_exists:
+        return {'outcome': 'user_not_found'}
+    if new_balance is not None:
+        return {'outcome': 'ok', 'amount': amount, 'new_balance': new_balance}
+    if claimed or used_before:
+        return {'outcome': 'already_used'}
+    return {'outcome': 'limit_reached'}
@@ -0,0 +1,154 @@
+'''
+Business: Per-user token buckets that reject bursts of game actions before a DB connection is taken
+Args: handler event, per-action (tokens per second, burst) limits; RATE_LIMITS / RATE_LIMIT_* env overrides
+Returns: 429 response with Retry-After when the user's bucket for the action is empty, else the handler's response
+
+Buckets live in a bounded in-process LRU keyed by (user_id, action); buckets idle
+longer than RATE_LIMIT_IDLE_SECONDS are evicted, which loses nothing because an
+idle bucket is full anyway. With RATE_LIMIT_BACKEND=postgres a request that the
+local bucket admits is also charged against rate_limit_buckets, so the limit
+holds across instances; requests the local bucket rejects never reach PostgreSQL.
+'''
+
+import json
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from db import get_db_connection
+from router import parse_body
+
+MAX_BUCKETS = int(os.environ.get('RATE_LIMIT_MAX_BUCKETS', '10000'))
+IDLE_SECONDS = float(os.environ.get('RATE_LIMIT_IDLE_SECONDS', '300'))
+BACKEND = os.environ.get('RATE_LIMIT_BACKEND', 'memory')
+
+SHARED_TAKE_SQL = '''
+INSERT INTO rate_limit_buckets AS b (user_id, action, tokens, updated_at)
+VALUES (%(user_id)s, %(action)s, %(burst)s - 1, clock_timestamp())
+ON CONFLICT (user_id, action) DO UPDATE
+SET tokens = LEAST(%(burst)s, b.tokens + EXTRACT(EPOCH FROM clock_timestamp() - b.updated_at) * %(rate)s) - 1,
+    updated_at = clock_timestamp()
+WHERE LEAST(%(burst)s, b.tokens + EXTRACT(EPOCH FROM clock_timestamp() - b.updated_at) * %(rate)s) >= 1
+RETURNING tokens
+'''
+
+JSON_HEADERS = {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}
+
+
+class TokenBucket:
+    __slots__ = ('tokens', 'updated_at')
+
+    def __init__(self, burst: float, now: float):
+        self.tokens = burst
+        self.updated_at = now
+
+    def take(self, rate: float, burst: float, now: float) -> float:
+        '''0 when a token was taken, otherwise seconds until one is available.'''
+        self.tokens = min(burst, self.tokens + (now - self.updated_at) * rate)
+        self.updated_at = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / rate
+
+
+_buckets: 'OrderedDict[Tuple[int, str], TokenBucket]' = OrderedDict()
+_lock = threading.Lock()
+stats = {'allowed': 0, 'limited': 0, 'shared_limited': 0, 'evicted': 0}
+
+
+def parse_limits(spec: str) -> Dict[str, Tuple[float, float]]:
+    '''"coinflip=5/10,cards=2/4" -> {'coinflip': (5.0, 10.0), 'cards': (2.0, 4.0)}; raises ValueError.'''
+    limits = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        action, _, limit = item.partition('=')
+        rate, _, burst = limit.partition('/')
+        try:
+            rate, burst = float(rate), float(burst or rate)
+        except ValueError:
+            raise ValueError(f'RATE_LIMITS: {item!r} is not action=rate/burst') from None
+        # A zero rate would divide by zero computing Retry-After; a burst below 1 never admits anything
+        if not (0 < rate < math.inf and 1 <= burst < math.inf):
+            raise ValueError(f'RATE_LIMITS: {item!r} needs a rate above 0 and a burst of at least 1')
+        limits[action.strip()] = (rate, burst)
+    return limits
+
+
+def _evict(now: float) -> None:
+    while _buckets:
+        oldest = next(iter(_buckets.values()))
+        if len(_buckets) <= MAX_BUCKETS and now - oldest.updated_at < IDLE_SECONDS:
+            break
+        _buckets.popitem(last=False)
+        stats['evicted'] += 1
+
+
+def take_local(user_id: int, action: str, rate: float, burst: float) -> float:
+    now = time.monotonic()
+    with _lock:
+        bucket = _buckets.get((user_id, action))
+        if bucket is None:
+            bucket = _buckets[(user_id, action)] = TokenBucket(burst, now)
+        else:
+            _buckets.move_to_end((user_id, action))
+        wait = bucket.take(rate, burst, now)
+        _evict(now)
+    return wait
+
+
+def take_shared(user_id: int, action: str, rate: float, burst: float) -> bool:
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute(SHARED_TAKE_SQL, {'user_id': user_id, 'action': action, 'rate': rate, 'burst': burst})
+        allowed = cur.fetchone() is not None
+        conn.commit()
+        return allowed
+    finally:
+        cur.close()
+        conn.close()
+
+
+def _limited(wait: float) -> Dict[str, Any]:
+    headers = dict(JSON_HEADERS, **{'Retry-After': str(max(1, math.ceil(wait)))})
+    return {'statusCode': 429, 'headers': headers, 'body': json.dumps({'error': 'Too many requests'})}
+
+
+def _request(event: Dict[str, Any]) -> Optional[Tuple[int, str]]:
+    if event.get('httpMethod') != 'POST':
+        return None
+    try:
+        body = parse_body(event)
+        return int(body['user_id']), body['action']
+    except (ValueError, TypeError, KeyError):
+        return None
+
+
+def rate_limited(limits: Dict[str, Tuple[float, float]]) -> Callable:
+    '''Handler decorator: per-user buckets for the actions in `limits`, overridable by RATE_LIMITS env.'''
+    limits = dict(limits, **parse_limits(os.environ.get('RATE_LIMITS', '')))
+
+    def decorate(fn: Callable[..., Dict[str, Any]]) -> Callable[..., Dict[str, Any]]:
+        @wraps(fn)
+        def wrapper(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+            request = _request(event)
+            if request is None or request[1] not in limits:
+                return fn(event, context)
+            user_id, action = request
+            rate, burst = limits[action]
+
+            wait = take_local(user_id, action, rate, burst)
+            if wait:
+                stats['limited'] += 1
+                return _limited(wait)
+            if BACKEND == 'postgres' and not take_shared(user_id, action, rate, burst):
+                stats['shared_limited'] += 1
+                return _limited(1 / rate)
+            stats['allowed'] += 1
+            return fn(event, context)
+        return wrapper
+    return decorate
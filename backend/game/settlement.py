@@ -0,0 +1,107 @@
+'''
+Business: Single round-trip bet settlement - debit, credit and ledger row in one conditional statement
+Args: open cursor, user id, game, bet, payout, optional ledger reference
+Returns: the new balance, or None when the user is missing or cannot cover the bet
+
+The balance check lives in the UPDATE's WHERE clause, so concurrent bets can
+never drive a balance negative and no separate SELECT is needed.
+
+The auth function's profile cache is told about changed balances without touching
+the bet's transaction: a pg_notify inside it would take the database-wide
+notification queue lock at commit and serialize all bet commits. Instead the
+users a request changed are collected (balance_changed) and, once the handler
+has committed and answered below 400, @announces_balances evicts them with one
+NOTIFY statement on its own connection. Payloads are bare ids, so an eviction
+that arrives out of order is harmless; a lost one is bounded by PROFILE_CACHE_TTL.
+'''
+
+import threading
+from decimal import Decimal
+from functools import wraps
+from typing import Any, Callable, Dict, Iterable, Optional
+
+import psycopg2
+
+from db import get_db_connection
+from ledger import to_money
+
+ANNOUNCE_SQL = "SELECT pg_notify('user_profile', id::text) FROM unnest(%s::int[]) AS id"
+
+_changed = threading.local()
+
+SETTLE_SQL = '''
+UPDATE users SET balance = balance - %(bet)s + %(payout)s
+WHERE id = %(user_id)s AND balance >= %(required)s
+RETURNING balance
+'''
+
+SETTLE_WITH_LEDGER_SQL = '''
+WITH settled AS (
+    UPDATE users SET balance = balance - %(bet)s + %(payout)s
+    WHERE id = %(user_id)s AND balance >= %(required)s
+    RETURNING balance
+), ledger AS (
+    INSERT INTO balance_ledger (user_id, game, bet, payout, delta, balance_after, reference)
+    SELECT %(user_id)s, %(game)s, %(bet)s, %(payout)s, %(delta)s, balance, %(reference)s FROM settled
+)
+SELECT balance FROM settled
+'''
+
+
+def settle(cur: Any, user_id: int, game: str, bet: Any, payout: Any,
+           reference: Optional[str] = None, ledger: bool = True, required: Any = None) -> Optional[Decimal]:
+    '''
+    ledger=False skips the ledger row, for multi-round actions that batch their own entries.
+    required overrides the balance the user must hold (default: the bet), e.g. the peak drawdown of a run.
+    '''
+    bet, payout = to_money(bet), to_money(payout)
+    cur.execute(SETTLE_WITH_LEDGER_SQL if ledger else SETTLE_SQL, {
+        'user_id': user_id,
+        'game': game,
+        'bet': bet,
+        'payout': payout,
+        'delta': payout - bet,
+        'reference': reference,
+        'required': bet if required is None else to_money(required)
+    })
+    row = cur.fetchone()
+    if row is None:
+        return None
+    balance_changed((user_id,))
+    return row[0]
+
+
+def balance_changed(user_ids: Iterable[int]) -> None:
+    '''Marks users whose balance the current request changed; announced after the handler returns.'''
+    pending = getattr(_changed, 'ids', None)
+    if pending is not None:
+        pending.update(user_ids)
+
+
+def _announce(user_ids: Iterable[int]) -> None:
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute(ANNOUNCE_SQL, (sorted(user_ids),))
+        conn.commit()
+    except psycopg2.Error:
+        conn.rollback()
+    finally:
+        cur.close()
+        conn.close()
+
+
+def announces_balances(fn: Callable[..., Dict[str, Any]]) -> Callable[..., Dict[str, Any]]:
+    '''Handler decorator: evicts the changed users from the auth profile cache after a successful request.'''
+    @wraps(fn)
+    def wrapper(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+        _changed.ids = set()
+        try:
+            response = fn(event, context)
+            changed = _changed.ids
+        finally:
+            _changed.ids = None
+        if changed and response.get('statusCode', 500) < 400:
+            _announce(changed)
+        return response
+    return wrapper
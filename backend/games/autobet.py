@@ -0,0 +1,76 @@
+'''
+Business: Server-side auto-bet for coinflip and cards - many rounds, one request, one net settlement
+Args: game, round count, base bet, coinflip side, stop-loss / take-profit limits and the starting balance
+Returns: per-round (bet, payout) pairs, compact outcome strings and why the run stopped
+
+Money is kept in whole cents: the bet is quantized once and every payout per round,
+so the totals settled on the balance are exactly the sums of the per-round ledger rows.
+'''
+
+import random
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+
+from ledger import to_money
+from rules import (
+    COINFLIP_SIDES, coinflip_side, coinflip_payout,
+    cards_won, cards_dealer_card, cards_payout
+)
+
+MAX_ROUNDS = 1000
+GAMES = ('coinflip', 'cards')
+
+
+def play(game: str, rounds: int, amount: Any, balance: Any, choice: Optional[str] = None,
+         stop_loss: Optional[float] = None, take_profit: Optional[float] = None) -> Dict[str, Any]:
+    rand = random.random
+    amount, balance = to_money(amount), to_money(balance)
+    played: List[Tuple[Decimal, Decimal]] = []
+    wins: List[str] = []
+    outcomes: List[Any] = []
+    net = Decimal(0)
+    stopped_by = 'rounds'
+
+    for _ in range(rounds):
+        if balance + net < amount:
+            stopped_by = 'balance'
+            break
+
+        if game == 'coinflip':
+            side = COINFLIP_SIDES[coinflip_side(rand())]
+            won = side == choice
+            payout = coinflip_payout(amount, won)
+            outcomes.append(side[0])
+        else:
+            outcomes.append(int(cards_dealer_card(rand())))
+            won = cards_won(rand())
+            payout = cards_payout(amount, won)
+
+        played.append((amount, payout))
+        wins.append('1' if won else '0')
+        net += payout - amount
+
+        if stop_loss is not None and net <= -stop_loss:
+            stopped_by = 'stop_loss'
+            break
+        if take_profit is not None and net >= take_profit:
+            stopped_by = 'take_profit'
+            break
+
+    drawdown = Decimal(0)
+    running = Decimal(0)
+    for bet, payout in played:
+        running -= bet
+        drawdown = max(drawdown, -running)
+        running += payout
+
+    return {
+        'rounds': played,
+        'wins': ''.join(wins),
+        'outcomes': ''.join(outcomes) if game == 'coinflip' else outcomes,
+        'total_bet': sum((bet for bet, _ in played), Decimal(0)),
+        'total_payout': sum((payout for _, payout in played), Decimal(0)),
+        'net': net,
+        'max_drawdown': drawdown,
+        'stopped_by': stopped_by
+    }
@@ -0,0 +1,213 @@
+'''
+Business: Server-authoritative Crash rounds on one timeline shared by every player and instance
+Args: open cursor plus user bet/cashout requests; rounds come from the precomputed crash_rounds hash chain
+Returns: round state, accepted bets, cashout multipliers and batch settlement results
+
+Round timeline (all timestamps precomputed by tools/crash_chain.py):
+betting_opens_at -> starts_at (flight begins at 1.00x) -> crashes_at (multiplier hits crash_point).
+Cashout multipliers are computed from the database clock, never from the client.
+Payouts are credited per round in one statement once the round has crashed.
+'''
+
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from rules import CRASH_GROWTH_PER_SECOND, crash_multiplier_at
+from settlement import balance_changed
+
+SCHEDULE_REFRESH_SECONDS = 30
+SCHEDULE_WINDOW = 50
+SETTLE_BATCH = 20
+
+# (round_id, betting_opens_at, starts_at, crashes_at) as epoch seconds, oldest first
+_schedule: List[Tuple[int, float, float, float]] = []
+_schedule_loaded_at = 0.0
+_settled_through = 0
+_revealed: Optional[Dict[str, Any]] = None
+
+PLACE_BET_SQL = '''
+INSERT INTO crash_bets (round_id, user_id, amount, auto_cashout)
+SELECT id, %s, %s, %s FROM crash_rounds
+WHERE starts_at > clock_timestamp()
+ORDER BY starts_at
+LIMIT 1
+ON CONFLICT (round_id, user_id) DO NOTHING
+RETURNING round_id
+'''
+
+# Once the flight has passed the bet's auto_cashout, that auto cashout has already fired:
+# a late manual cashout is capped at it (LEAST ignores a NULL auto_cashout).
+CASHOUT_SQL = '''
+UPDATE crash_bets b
+SET cashout_at = LEAST(FLOOR((1 + %s * EXTRACT(EPOCH FROM clock_timestamp() - r.starts_at)) * 100) / 100, b.auto_cashout)
+FROM crash_rounds r
+WHERE b.round_id = r.id
+  AND b.user_id = %s
+  AND b.cashout_at IS NULL
+  AND r.starts_at <= clock_timestamp()
+  AND r.crashes_at > clock_timestamp()
+RETURNING b.round_id, b.amount, b.cashout_at
+'''
+
+# Rounds nobody bet on are closed in the same statement, so a backlog of empty rounds
+# never takes up the batch ahead of rounds with winners waiting to be paid
+DUE_ROUNDS_SQL = '''
+WITH empty AS (
+    UPDATE crash_rounds r SET settled_at = clock_timestamp()
+    WHERE r.settled_at IS NULL AND r.crashes_at <= clock_timestamp()
+      AND NOT EXISTS (SELECT 1 FROM crash_bets b WHERE b.round_id = r.id)
+)
+SELECT r.id FROM crash_rounds r
+WHERE r.settled_at IS NULL AND r.crashes_at <= clock_timestamp()
+  AND EXISTS (SELECT 1 FROM crash_bets b WHERE b.round_id = r.id)
+ORDER BY r.id
+LIMIT %s
+'''
+
+SETTLE_ROUND_SQL = '''
+WITH claimed AS (
+    UPDATE crash_rounds SET settled_at = clock_timestamp()
+    WHERE id = %(round_id)s AND settled_at IS NULL AND crashes_at <= clock_timestamp()
+    RETURNING id, crash_point
+), resolved AS (
+    UPDATE crash_bets b
+    SET cashout_at = COALESCE(b.cashout_at, CASE WHEN b.auto_cashout < c.crash_point THEN b.auto_cashout END),
+        payout = ROUND(b.amount * COALESCE(b.cashout_at, CASE WHEN b.auto_cashout < c.crash_point THEN b.auto_cashout END, 0), 2)
+    FROM claimed c
+    WHERE b.round_id = c.id
+    RETURNING b.user_id, b.payout
+), credited AS (
+    UPDATE users u SET balance = u.balance + r.payout
+    FROM resolved r
+    WHERE u.id = r.user_id AND r.payout > 0
+    RETURNING u.id, u.balance, r.payout
+), ledger AS (
+    INSERT INTO balance_ledger (user_id, game, bet, payout, delta, balance_after, reference)
+    SELECT id, 'crash', 0, payout, payout, balance, %(reference)s FROM credited
+)
+SELECT (SELECT COUNT(*) FROM claimed), (SELECT COUNT(*) FROM resolved),
+       (SELECT COUNT(*) FROM credited), (SELECT COALESCE(SUM(payout), 0) FROM credited),
+       (SELECT array_agg(id) FROM credited)
+'''
+
+
+def _epoch(value: datetime) -> float:
+    return value.timestamp()
+
+
+def _iso(epoch: float) -> str:
+    return datetime.fromtimestamp(epoch, timezone.utc).isoformat()
+
+
+def load_schedule(cur: Any, force: bool = False) -> None:
+    global _schedule, _schedule_loaded_at
+    now = time.time()
+    if not force and _schedule and now - _schedule_loaded_at < SCHEDULE_REFRESH_SECONDS and _schedule[-1][3] > now:
+        return
+    cur.execute(
+        "SELECT id, betting_opens_at, starts_at, crashes_at FROM crash_rounds "
+        "WHERE crashes_at > clock_timestamp() - INTERVAL '1 minute' ORDER BY id LIMIT %s",
+        (SCHEDULE_WINDOW,)
+    )
+    _schedule = [(r[0], _epoch(r[1]), _epoch(r[2]), _epoch(r[3])) for r in cur.fetchall()]
+    _schedule_loaded_at = now
+
+
+def round_at(now: float) -> Optional[Tuple[int, float, float, float]]:
+    '''The round that is taking bets, flying or just crashed at `now`.'''
+    for entry in _schedule:
+        if now < entry[3]:
+            return entry
+    return None
+
+
+def last_crashed(now: float) -> Optional[Tuple[int, float, float, float]]:
+    crashed = [entry for entry in _schedule if entry[3] <= now]
+    return crashed[-1] if crashed else None
+
+
+def reveal(cur: Any, round_id: int) -> Dict[str, Any]:
+    '''Hash and crash point of a finished round, so players can verify the chain.'''
+    global _revealed
+    if _revealed is None or _revealed['round_id'] != round_id:
+        cur.execute(
+            "SELECT id, crash_point, hash FROM crash_rounds WHERE id = %s AND crashes_at <= clock_timestamp()",
+            (round_id,)
+        )
+        row = cur.fetchone()
+        if not row:
+            return {}
+        _revealed = {'round_id': row[0], 'crash_point': float(row[1]), 'hash': row[2]}
+    return _revealed
+
+
+def state(cur: Any) -> Optional[Dict[str, Any]]:
+    load_schedule(cur)
+    now = time.time()
+    current = round_at(now)
+    if current is None:
+        return None
+
+    round_id, opens_at, starts_at, crashes_at = current
+    result = {
+        'round_id': round_id,
+        'server_time': _iso(now),
+        'betting_opens_at': _iso(opens_at),
+        'starts_at': _iso(starts_at),
+        'phase': 'betting' if now < starts_at else 'flying'
+    }
+    if now >= starts_at:
+        result['multiplier'] = round(crash_multiplier_at(now - starts_at), 2)
+
+    previous = last_crashed(now)
+    if previous is not None:
+        result['previous'] = reveal(cur, previous[0])
+    return result
+
+
+def place_bet(cur: Any, user_id: int, amount: float, auto_cashout: Optional[float]) -> Optional[int]:
+    '''Registers the bet on the next round that has not started yet; None if already in or no round.'''
+    cur.execute(PLACE_BET_SQL, (user_id, amount, auto_cashout))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def cash_out(cur: Any, user_id: int) -> Optional[Dict[str, Any]]:
+    '''Locks in the current server-clock multiplier; the payout is credited at round settlement.'''
+    cur.execute(CASHOUT_SQL, (CRASH_GROWTH_PER_SECOND, user_id))
+    row = cur.fetchone()
+    if not row:
+        return None
+    # Nothing about the crash time may leave before the round has crashed; crash_state reveals it then
+    round_id, amount, multiplier = row
+    return {
+        'round_id': round_id,
+        'multiplier': float(multiplier),
+        'payout': round(float(amount) * float(multiplier), 2)
+    }
+
+
+def settle_round(cur: Any, round_id: int) -> Dict[str, Any]:
+    cur.execute(SETTLE_ROUND_SQL, {'round_id': round_id, 'reference': f'crash:{round_id}'})
+    claimed, bets, winners, paid, credited = cur.fetchone()
+    balance_changed(credited or ())
+    return {'round_id': round_id, 'settled': bool(claimed), 'bets': bets, 'winners': winners, 'paid': float(paid)}
+
+
+def settle_due(cur: Any) -> List[Dict[str, Any]]:
+    '''Settles every crashed, unsettled round; cheap no-op while the cached schedule says none is due.'''
+    global _settled_through
+    load_schedule(cur)
+    now = time.time()
+    previous = last_crashed(now)
+    if _schedule and (previous is None or previous[0] <= _settled_through):
+        return []
+
+    cur.execute(DUE_ROUNDS_SQL, (SETTLE_BATCH,))
+    due = cur.fetchall()
+    results = [settle_round(cur, row[0]) for row in due]
+    # A full batch may have left rounds behind; only skip the query once the backlog is drained
+    if previous is not None and len(due) < SETTLE_BATCH:
+        _settled_through = max(_settled_through, previous[0])
+    return results
@@ -0,0 +1,236 @@
+'''
+Business: Warm PostgreSQL connection pool shared by every invocation of the function instance
+Args: DATABASE_URL env, optional DB_POOL_MAX, DB_POOL_ACQUIRE_TIMEOUT, DB_POOL_HEALTH_CHECK_AFTER, DB_POOL_WARM
+Returns: pooled connections whose close() hands them back to the pool
+'''
+
+import os
+import threading
+import time
+from functools import wraps
+from typing import Any, Callable, Dict, List, Optional
+
+import psycopg2
+import psycopg2.extensions
+
+import metrics
+
+POOL_MAX = int(os.environ.get('DB_POOL_MAX', '4'))
+ACQUIRE_TIMEOUT = float(os.environ.get('DB_POOL_ACQUIRE_TIMEOUT', '10'))
+HEALTH_CHECK_AFTER = float(os.environ.get('DB_POOL_HEALTH_CHECK_AFTER', '30'))
+WARM_CONNECTIONS = int(os.environ.get('DB_POOL_WARM', '1'))
+CONNECT_ATTEMPTS = 3
+
+CONNECT_KWARGS = {
+    'connect_timeout': 5,
+    'keepalives': 1,
+    'keepalives_idle': 30,
+    'keepalives_interval': 10,
+    'keepalives_count': 3
+}
+
+
+class PooledConnection:
+    '''Proxy around a psycopg2 connection; close() returns it to the pool instead of closing.'''
+
+    __slots__ = ('_pool', '_raw', 'released')
+
+    def __init__(self, pool: 'ConnectionPool', raw: psycopg2.extensions.connection):
+        self._pool = pool
+        self._raw = raw
+        self.released = False
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._raw, name)
+
+    @property
+    def raw(self) -> psycopg2.extensions.connection:
+        return self._raw
+
+    def close(self) -> None:
+        if not self.released:
+            self.released = True
+            self._pool.release(self._raw)
+
+
+class ConnectionPool:
+    def __init__(self, dsn: str, maxconn: int):
+        self.dsn = dsn
+        self.maxconn = maxconn
+        self._idle: List[tuple] = []
+        self._size = 0
+        self._cond = threading.Condition()
+        self._local = threading.local()
+        self.counters: Dict[str, float] = {
+            'created': 0,
+            'discarded': 0,
+            'acquired': 0,
+            'reused': 0,
+            'waits': 0,
+            'wait_ms_total': 0.0,
+            'wait_ms_max': 0.0,
+            'health_check_failures': 0,
+            'connect_failures': 0
+        }
+
+    def _connect(self) -> psycopg2.extensions.connection:
+        last_error: Optional[Exception] = None
+        for attempt in range(CONNECT_ATTEMPTS):
+            started = time.perf_counter()
+            try:
+                conn = psycopg2.connect(self.dsn, **CONNECT_KWARGS)
+                metrics.observe('db_connect_seconds', time.perf_counter() - started)
+                self.counters['created'] += 1
+                return conn
+            except psycopg2.OperationalError as e:
+                self.counters['connect_failures'] += 1
+                last_error = e
+                time.sleep(0.05 * (2 ** attempt))
+        raise last_error
+
+    def _healthy(self, conn: psycopg2.extensions.connection, idle_since: float) -> bool:
+        if conn.closed:
+            return False
+        if time.monotonic() - idle_since < HEALTH_CHECK_AFTER:
+            return True
+        try:
+            cur = conn.cursor()
+            cur.execute('SELECT 1')
+            cur.close()
+            conn.rollback()
+            return True
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            self.counters['health_check_failures'] += 1
+            return False
+
+    def _discard(self, conn: psycopg2.extensions.connection) -> None:
+        self.counters['discarded'] += 1
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def acquire(self) -> PooledConnection:
+        started = time.monotonic()
+        waited = False
+        conn = None
+        with self._cond:
+            while conn is None:
+                if self._idle:
+                    candidate, idle_since = self._idle.pop()
+                    if self._healthy(candidate, idle_since):
+                        conn = candidate
+                        self.counters['reused'] += 1
+                    else:
+                        self._size -= 1
+                        self._discard(candidate)
+                    continue
+                if self._size < self.maxconn:
+                    self._size += 1
+                    break
+                waited = True
+                remaining = ACQUIRE_TIMEOUT - (time.monotonic() - started)
+                if remaining <= 0 or not self._cond.wait(remaining):
+                    if not self._idle and self._size >= self.maxconn:
+                        raise psycopg2.OperationalError('Connection pool exhausted')
+
+        if conn is None:
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+
+        wait_ms = (time.monotonic() - started) * 1000
+        self.counters['acquired'] += 1
+        if waited:
+            self.counters['waits'] += 1
+            self.counters['wait_ms_total'] += wait_ms
+            self.counters['wait_ms_max'] = max(self.counters['wait_ms_max'], wait_ms)
+
+        pooled = PooledConnection(self, conn)
+        self._checked_out().append(pooled)
+        return pooled
+
+    def release(self, conn: psycopg2.extensions.connection) -> None:
+        keep = not conn.closed
+        if keep and conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                keep = False
+        with self._cond:
+            if keep:
+                self._idle.append((conn, time.monotonic()))
+            else:
+                self._size -= 1
+                self._discard(conn)
+            self._cond.notify()
+
+    def _checked_out(self) -> List[PooledConnection]:
+        if not hasattr(self._local, 'checked_out'):
+            self._local.checked_out = []
+        return self._local.checked_out
+
+    def release_checked_out(self) -> None:
+        '''Return every connection the current thread still holds, e.g. after an exception.'''
+        checked_out = self._checked_out()
+        while checked_out:
+            checked_out.pop().close()
+
+    def stats(self) -> Dict[str, float]:
+        with self._cond:
+            return {
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'max': self.maxconn,
+                **self.counters
+            }
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(os.environ['DATABASE_URL'], POOL_MAX)
+    return _pool
+
+
+def get_db_connection() -> PooledConnection:
+    return get_pool().acquire()
+
+
+def warm(count: int = WARM_CONNECTIONS) -> None:
+    '''Opens (or health-checks) up to `count` connections and leaves them idle, e.g. from a scheduled ping.'''
+    pool = get_pool()
+    opened: List[PooledConnection] = []
+    try:
+        while len(opened) < min(count, pool.maxconn):
+            opened.append(pool.acquire())
+    finally:
+        for conn in opened:
+            conn.close()
+
+
+def pool_stats() -> Dict[str, float]:
+    return get_pool().stats() if _pool is not None else {'size': 0, 'idle': 0, 'in_use': 0, 'max': POOL_MAX}
+
+
+def releases_connections(fn: Callable[..., Dict[str, Any]]) -> Callable[..., Dict[str, Any]]:
+    '''Handler decorator: hands back connections left checked out by early returns or errors.'''
+    @wraps(fn)
+    def wrapper(*args: Any, **kwargs: Any) -> Dict[str, Any]:
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            if _pool is not None:
+                _pool.release_checked_out()
+    return wrapper
@@ -4,290 +4,313 @@ Args: event with httpMethod, body with game type and bet details
 Returns: HTTP response with game results
 '''
 
-import json
-import os
-import psycopg2
-from typing import Dict, Any
 import random
+from decimal import Decimal
+from typing import Dict, Any
+from db import releases_connections, pool_stats, warm
+from idempotency import idempotent
+from metrics import instrumented, snapshot
+from profiling import profiled
+from ratelimit import rate_limited
+from router import Router, Request, NUMBER, respond, error
+from ledger import CENT, record_many, round_entries, to_money
+from settlement import announces_balances, settle
+import crash
+import mines
+import autobet
+from rules import (
+    MIN_BETS, COINFLIP_SIDES, coinflip_side, coinflip_payout,
+    cards_won, cards_dealer_card, cards_payout,
+    MINES_CELLS, MINES_DEFAULT_COUNT, MINES_MIN_COUNT, MINES_MAX_COUNT
+)
+
+MUTATING_ACTIONS = (
+    'coinflip', 'crash_bet', 'crash_cashout', 'mines_bet',
+    'mines_reveal', 'mines_cashout', 'cards', 'autobet'
+)
+
+# (tokens per second, burst) per user; RATE_LIMITS env overrides, e.g. "coinflip=2/5"
+RATE_LIMITS = {
+    'coinflip': (5, 10),
+    'cards': (5, 10),
+    'crash_bet': (2, 4),
+    'crash_cashout': (5, 10),
+    'crash_state': (10, 20),
+    'mines_bet': (2, 5),
+    'mines_reveal': (10, 20),
+    'mines_cashout': (5, 10),
+    'autobet': (0.2, 2)
+}
+
+INSUFFICIENT_BALANCE = 'Insufficient balance'
+
+router = Router()
+
+
+@router.action('coinflip', fields={'amount': NUMBER})
+def coinflip(req: Request) -> Dict[str, Any]:
+    # Stake and payout both come from the bet in whole cents, so the credit matches the debit
+    amount = to_money(req.get('amount', 0))
+    choice = req.get('choice')
+
+    if amount < MIN_BETS['coinflip']:
+        return error(400, f"Minimum bet is {MIN_BETS['coinflip']}")
+
+    result = COINFLIP_SIDES[coinflip_side(random.random())]
+    won = result == choice
+    payout = coinflip_payout(amount, won)
+
+    new_balance = settle(req.cur, req.user_id, 'coinflip', amount, payout)
+
+    if new_balance is None:
+        return error(400, INSUFFICIENT_BALANCE)
+
+    req.commit()
+
+    return respond({
+        'won': won,
+        'result': result,
+        'payout': float(payout),
+        'new_balance': float(new_balance)
+    })
+
+
+@router.action('crash_state')
+def crash_state(req: Request) -> Dict[str, Any]:
+    # Schedule, reveal and settlement checks are cached; the lazy cursor only connects on a miss
+    round_state = crash.state(req.lazy_cur)
+    crash.settle_due(req.lazy_cur)
+    req.commit()
+
+    if not round_state:
+        return error(503, 'No crash round scheduled')
+
+    return respond(round_state)
+
+
+@router.action('crash_bet', fields={'amount': NUMBER, 'auto_cashout': NUMBER})
+def crash_bet(req: Request) -> Dict[str, Any]:
+    amount = req.get('amount', 0)
+    auto_cashout = req.get('auto_cashout')
+
+    if amount < MIN_BETS['crash']:
+        return error(400, f"Minimum bet is {MIN_BETS['crash']}")
+
+    if auto_cashout is not None and auto_cashout <= 1:
+        return error(400, 'auto_cashout must be greater than 1')
+
+    round_id = crash.place_bet(req.cur, req.user_id, amount, auto_cashout)
+
+    if round_id is None:
+        req.rollback()
+        return error(400, 'Bet already placed or no crash round open')
+
+    new_balance = settle(req.cur, req.user_id, 'crash', amount, 0, reference=f'crash:{round_id}')
+
+    if new_balance is None:
+        req.rollback()
+        return error(400, INSUFFICIENT_BALANCE)
+
+    crash.settle_due(req.cur)
+    req.commit()
+
+    return respond({'new_balance': float(new_balance), 'round_id': round_id})
+
+
+@router.action('crash_cashout')
+def crash_cashout(req: Request) -> Dict[str, Any]:
+    cashout = crash.cash_out(req.cur, req.user_id)
+
+    if not cashout:
+        req.rollback()
+        return error(400, 'No active crash bet to cash out')
+
+    req.commit()
+
+    return respond(cashout)
+
+
+@router.action('mines_bet', fields={'amount': NUMBER, 'mines': int})
+def mines_bet(req: Request) -> Dict[str, Any]:
+    amount = req.get('amount', 0)
+    mine_count = req.get('mines', MINES_DEFAULT_COUNT)
+
+    if amount < MIN_BETS['mines']:
+        return error(400, f"Minimum bet is {MIN_BETS['mines']}")
+
+    if not MINES_MIN_COUNT <= mine_count <= MINES_MAX_COUNT:
+        return error(400, f'mines must be between {MINES_MIN_COUNT} and {MINES_MAX_COUNT}')
+
+    session = mines.start(req.cur, req.user_id, amount, mine_count)
+
+    if not session:
+        req.rollback()
+        return error(400, 'Finish the current Mines game first')
+
+    new_balance = settle(req.cur, req.user_id, 'mines', amount, 0, reference=f'mines:{session.id}')
+
+    if new_balance is None:
+        req.rollback()
+        mines.forget(req.user_id)
+        return error(400, INSUFFICIENT_BALANCE)
+
+    req.commit()
+
+    return respond({'new_balance': float(new_balance), 'session_id': session.id, 'mines': mine_count})
+
+
+@router.action('mines_reveal', require=('user_id', 'index'), fields={'index': int})
+def mines_reveal(req: Request) -> Dict[str, Any]:
+    cell = req.get('index')
+
+    if not 0 <= cell < MINES_CELLS:
+        return error(400, f'index must be between 0 and {MINES_CELLS - 1}')
+
+    outcome = mines.reveal(req.cur, req.user_id, cell)
+
+    if not outcome:
+        req.rollback()
+        return error(404, 'No active Mines game')
+
+    session = outcome.pop('session', None)
+
+    if outcome['finished'] and not outcome['isMine']:
+        if not mines.finish(req.cur, session):
+            req.rollback()
+            return error(409, 'Game state changed, retry')
+
+        payout = (session.bet * Decimal(str(session.multiplier))).quantize(CENT)
+        new_balance = settle(req.cur, req.user_id, 'mines', 0, payout, reference=f'mines:{session.id}')
+        outcome['payout'] = float(payout)
+        outcome['new_balance'] = float(new_balance)
+
+    req.commit()
+
+    return respond(outcome)
+
+
+@router.action('mines_cashout')
+def mines_cashout(req: Request) -> Dict[str, Any]:
+    session = mines.load(req.cur, req.user_id)
+
+    if not session:
+        return error(404, 'No active Mines game')
+
+    if session.revealed_count == 0:
+        return error(400, 'Reveal at least one cell first')
+
+    if not mines.finish(req.cur, session):
+        req.rollback()
+        return error(409, 'Game state changed, retry')
+
+    multiplier = session.multiplier
+    payout = (session.bet * Decimal(str(multiplier))).quantize(CENT)
+
+    new_balance = settle(req.cur, req.user_id, 'mines', 0, payout, reference=f'mines:{session.id}')
+    req.commit()
+
+    return respond({
+        'payout': float(payout),
+        'multiplier': multiplier,
+        'mines': session.mine_cells(),
+        'new_balance': float(new_balance)
+    })
+
+
+@router.action('cards', fields={'amount': NUMBER})
+def cards(req: Request) -> Dict[str, Any]:
+    amount = to_money(req.get('amount', 0))
+
+    if amount < MIN_BETS['cards']:
+        return error(400, f"Minimum bet is {MIN_BETS['cards']}")
+
+    dealer_card = int(cards_dealer_card(random.random()))
+    won = cards_won(random.random())
+    payout = cards_payout(amount, won)
+
+    new_balance = settle(req.cur, req.user_id, 'cards', amount, payout)
+
+    if new_balance is None:
+        return error(400, INSUFFICIENT_BALANCE)
+
+    req.commit()
+
+    return respond({
+        'won': won,
+        'dealerCard': dealer_card,
+        'payout': float(payout),
+        'new_balance': float(new_balance)
+    })
+
+
+@router.action('autobet', require=('user_id', 'game', 'rounds', 'amount'), fields={
+    'rounds': int, 'amount': NUMBER, 'stop_loss': NUMBER, 'take_profit': NUMBER
+})
+def autobet_rounds(req: Request) -> Dict[str, Any]:
+    game = req.get('game')
+    rounds = req.get('rounds')
+    amount = req.get('amount')
+    choice = req.get('choice')
+    stop_loss = req.get('stop_loss')
+    take_profit = req.get('take_profit')
+
+    if game not in autobet.GAMES:
+        return error(400, f"game must be one of {', '.join(autobet.GAMES)}")
+    if not 1 <= rounds <= autobet.MAX_ROUNDS:
+        return error(400, f'rounds must be between 1 and {autobet.MAX_ROUNDS}')
+    if amount < MIN_BETS[game]:
+        return error(400, f"Minimum bet is {MIN_BETS[game]}")
+    if game == 'coinflip' and choice not in COINFLIP_SIDES:
+        return error(400, f"choice must be one of {', '.join(COINFLIP_SIDES)}")
+    if any(limit is not None and limit <= 0 for limit in (stop_loss, take_profit)):
+        return error(400, 'stop_loss and take_profit must be positive')
+
+    req.cur.execute("SELECT balance FROM users WHERE id = %s FOR UPDATE", (req.user_id,))
+    balance = req.cur.fetchone()
+
+    run = autobet.play(game, rounds, amount, balance[0] if balance else 0, choice, stop_loss, take_profit)
+    new_balance = None
+    if run['rounds']:
+        new_balance = settle(req.cur, req.user_id, game, run['total_bet'], run['total_payout'],
+                             ledger=False, required=run['max_drawdown'])
+
+    if new_balance is None:
+        req.rollback()
+        return error(400, INSUFFICIENT_BALANCE)
+
+    record_many(req.cur, round_entries(req.user_id, game, run['rounds'], new_balance, reference='autobet'))
+    req.commit()
+
+    return respond({
+        'rounds_played': len(run['rounds']),
+        'wins': run['wins'],
+        'outcomes': run['outcomes'],
+        'total_bet': float(run['total_bet']),
+        'total_payout': float(run['total_payout']),
+        'net': float(run['net']),
+        'stopped_by': run['stopped_by'],
+        'new_balance': float(new_balance)
+    })
+
+
+@router.action('ping', db=False, require=())
+def ping(req: Request) -> Dict[str, Any]:
+    # Scheduled warm-up: pre-opens the pool so the next player request skips the connect
+    if req.get('warm', True):
+        warm()
+    return respond({'ok': True, 'pool': pool_stats()})
+
+
+@router.action('metrics', db=False, require=())
+def metrics_snapshot(req: Request) -> Dict[str, Any]:
+    return snapshot(req.get('token'), pool_stats())
 
-def get_db_connection():
-    return psycopg2.connect(os.environ['DATABASE_URL'])
 
+@instrumented(router)
+@profiled(router)
+@releases_connections
+@announces_balances
+@rate_limited(RATE_LIMITS)
+@idempotent(MUTATING_ACTIONS)
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
-    method: str = event.get('httpMethod', 'GET')
-    
-    if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': ''
-        }
-    
-    if method == 'POST':
-        body = json.loads(event.get('body', '{}'))
-        action = body.get('action')
-        user_id = body.get('user_id')
-        
-        if not user_id:
-            return {
-                'statusCode': 400,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Missing user_id'})
-            }
-        
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        if action == 'coinflip':
-            amount = body.get('amount', 0)
-            choice = body.get('choice')
-            
-            if amount < 35:
-                cur.close()
-                conn.close()
-                return {
-                    'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Minimum bet is 35'})
-                }
-            
-            cur.execute("SELECT balance FROM users WHERE id = %s", (user_id,))
-            balance = cur.fetchone()
-            
-            if not balance or balance[0] < amount:
-                cur.close()
-                conn.close()
-                return {
-                    'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Insufficient balance'})
-                }
-            
-            result = 'heads' if random.random() < 0.5 else 'tails'
-            won = result == choice
-            payout = amount * 2 if won else 0
-            
-            cur.execute(
-                "UPDATE users SET balance = balance - %s + %s WHERE id = %s RETURNING balance",
-                (amount, payout, user_id)
-            )
-            new_balance = cur.fetchone()[0]
-            conn.commit()
-            
-            cur.close()
-            conn.close()
-            
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({
-                    'won': won,
-                    'result': result,
-                    'payout': float(payout),
-                    'new_balance': float(new_balance)
-                })
-            }
-        
-        if action == 'crash_bet':
-            amount = body.get('amount', 0)
-            
-            if amount < 10:
-                cur.close()
-                conn.close()
-                return {
-                    'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Minimum bet is 10'})
-                }
-            
-            cur.execute("SELECT balance FROM users WHERE id = %s", (user_id,))
-            balance = cur.fetchone()
-            
-            if not balance or balance[0] < amount:
-                cur.close()
-                conn.close()
-                return {
-                    'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Insufficient balance'})
-                }
-            
-            cur.execute(
-                "UPDATE users SET balance = balance - %s WHERE id = %s RETURNING balance",
-                (amount, user_id)
-            )
-            new_balance = cur.fetchone()[0]
-            conn.commit()
-            
-            cur.close()
-            conn.close()
-            
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'new_balance': float(new_balance)})
-            }
-        
-        if action == 'crash_cashout':
-            amount = body.get('amount', 0)
-            multiplier = body.get('multiplier', 1.0)
-            
-            payout = amount * multiplier
-            
-            cur.execute(
-                "UPDATE users SET balance = balance + %s WHERE id = %s RETURNING balance",
-                (payout, user_id)
-            )
-            new_balance = cur.fetchone()[0]
-            conn.commit()
-            
-            cur.close()
-            conn.close()
-            
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({
-                    'payout': float(payout),
-                    'new_balance': float(new_balance)
-                })
-            }
-        
-        if action == 'mines_bet':
-            amount = body.get('amount', 0)
-            
-            if amount < 15:
-                cur.close()
-                conn.close()
-                return {
-                    'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Minimum bet is 15'})
-                }
-            
-            cur.execute("SELECT balance FROM users WHERE id = %s", (user_id,))
-            balance = cur.fetchone()
-            
-            if not balance or balance[0] < amount:
-                cur.close()
-                conn.close()
-                return {
-                    'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Insufficient balance'})
-                }
-            
-            cur.execute(
-                "UPDATE users SET balance = balance - %s WHERE id = %s RETURNING balance",
-                (amount, user_id)
-            )
-            new_balance = cur.fetchone()[0]
-            conn.commit()
-            
-            cur.close()
-            conn.close()
-            
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'new_balance': float(new_balance)})
-            }
-        
-        if action == 'mines_reveal':
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({
-                    'isMine': False,
-                    'multiplier': 1.4
-                })
-            }
-        
-        if action == 'mines_cashout':
-            amount = body.get('amount', 0)
-            multiplier = body.get('multiplier', 1.0)
-            
-            payout = amount * multiplier
-            
-            cur.execute(
-                "UPDATE users SET balance = balance + %s WHERE id = %s RETURNING balance",
-                (payout, user_id)
-            )
-            new_balance = cur.fetchone()[0]
-            conn.commit()
-            
-            cur.close()
-            conn.close()
-            
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({
-                    'payout': float(payout),
-                    'new_balance': float(new_balance)
-                })
-            }
-        
-        if action == 'cards':
-            amount = body.get('amount', 0)
-            choice = body.get('choice')
-            
-            if amount < 50:
-                cur.close()
-                conn.close()
-                return {
-                    'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Minimum bet is 50'})
-                }
-            
-            cur.execute("SELECT balance FROM users WHERE id = %s", (user_id,))
-            balance = cur.fetchone()
-            
-            if not balance or balance[0] < amount:
-                cur.close()
-                conn.close()
-                return {
-                    'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Insufficient balance'})
-                }
-            
-            dealer_card = random.randint(2, 14)
-            won = random.random() < 0.5
-            payout = amount * 2 if won else 0
-            
-            cur.execute(
-                "UPDATE users SET balance = balance - %s + %s WHERE id = %s RETURNING balance",
-                (amount, payout, user_id)
-            )
-            new_balance = cur.fetchone()[0]
-            conn.commit()
-            
-            cur.close()
-            conn.close()
-            
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({
-                    'won': won,
-                    'dealerCard': dealer_card,
-                    'payout': float(payout),
-                    'new_balance': float(new_balance)
-                })
-            }
-        
-        cur.close()
-        conn.close()
-    
-    return {
-        'statusCode': 405,
-        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-        'body': json.dumps({'error': 'Method not allowed'})
-    }
+    return router(event, context)
@@ -0,0 +1,166 @@
+'''
+Business: Stateful Mines sessions - 25-bit boards held in memory and persisted to mines_sessions
+Args: open cursor, user id, bet/mine count to start, cell index (0-24) to reveal
+Returns: reveal outcomes, multipliers from the precomputed table and cashout payouts
+
+A board is two ints: the mine bitmask and the revealed bitmask. Every write to
+mines_sessions is conditional on (id, revealed_mask), so an instance holding a
+stale cached copy detects it, reloads once and retries.
+'''
+
+import random
+import time
+from decimal import Decimal
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from rules import MINES_CELLS, MINES_MULTIPLIERS
+
+SESSION_TTL_SECONDS = 1800
+CACHE_SIZE = 10000
+
+LOAD_SQL = '''
+SELECT id, bet, mine_count, mines_mask, revealed_mask, EXTRACT(EPOCH FROM expires_at)
+FROM mines_sessions WHERE user_id = %s
+'''
+
+START_SQL = '''
+INSERT INTO mines_sessions (user_id, bet, mine_count, mines_mask, revealed_mask, expires_at)
+VALUES (%s, %s, %s, %s, 0, clock_timestamp() + make_interval(secs => %s))
+ON CONFLICT (user_id) DO UPDATE
+SET id = nextval('mines_sessions_id_seq'), bet = EXCLUDED.bet, mine_count = EXCLUDED.mine_count,
+    mines_mask = EXCLUDED.mines_mask, revealed_mask = 0, expires_at = EXCLUDED.expires_at
+WHERE mines_sessions.expires_at < clock_timestamp()
+RETURNING id, EXTRACT(EPOCH FROM expires_at)
+'''
+
+REVEAL_SQL = '''
+UPDATE mines_sessions SET revealed_mask = %s, expires_at = clock_timestamp() + make_interval(secs => %s)
+WHERE id = %s AND revealed_mask = %s AND expires_at > clock_timestamp()
+RETURNING EXTRACT(EPOCH FROM expires_at)
+'''
+
+FINISH_SQL = '''
+DELETE FROM mines_sessions WHERE id = %s AND revealed_mask = %s AND expires_at > clock_timestamp()
+RETURNING id
+'''
+
+
+class MinesSession:
+    __slots__ = ('id', 'user_id', 'bet', 'mine_count', 'mines', 'revealed', 'revealed_count', 'expires_at')
+
+    def __init__(self, session_id: int, user_id: int, bet: Any, mine_count: int,
+                 mines: int, revealed: int, expires_at: float):
+        self.id = session_id
+        self.user_id = user_id
+        self.bet = bet if isinstance(bet, Decimal) else Decimal(str(bet))
+        self.mine_count = mine_count
+        self.mines = mines
+        self.revealed = revealed
+        self.revealed_count = bin(revealed).count('1')
+        self.expires_at = expires_at
+
+    @property
+    def multiplier(self) -> float:
+        return MINES_MULTIPLIERS[self.mine_count][self.revealed_count]
+
+    @property
+    def cleared(self) -> bool:
+        return self.revealed_count == MINES_CELLS - self.mine_count
+
+    def mine_cells(self) -> list:
+        return [cell for cell in range(MINES_CELLS) if self.mines >> cell & 1]
+
+
+_sessions: 'OrderedDict[int, MinesSession]' = OrderedDict()
+
+
+def _cache(session: MinesSession) -> None:
+    _sessions[session.user_id] = session
+    _sessions.move_to_end(session.user_id)
+    now = time.time()
+    while _sessions:
+        oldest = next(iter(_sessions.values()))
+        if len(_sessions) <= CACHE_SIZE and oldest.expires_at > now:
+            break
+        _sessions.popitem(last=False)
+
+
+def forget(user_id: int) -> None:
+    _sessions.pop(user_id, None)
+
+
+def random_board(mine_count: int) -> int:
+    mask = 0
+    for cell in random.sample(range(MINES_CELLS), mine_count):
+        mask |= 1 << cell
+    return mask
+
+
+def load(cur: Any, user_id: int, refresh: bool = False) -> Optional[MinesSession]:
+    session = None if refresh else _sessions.get(user_id)
+    if session is not None and session.expires_at > time.time():
+        return session
+
+    cur.execute(LOAD_SQL, (user_id,))
+    row = cur.fetchone()
+    if not row or float(row[5]) <= time.time():
+        forget(user_id)
+        return None
+    session = MinesSession(row[0], user_id, row[1], row[2], row[3], row[4], float(row[5]))
+    _cache(session)
+    return session
+
+
+def start(cur: Any, user_id: int, bet: Any, mine_count: int) -> Optional[MinesSession]:
+    '''New board for the user; None while an unexpired game is still in progress.'''
+    mines = random_board(mine_count)
+    cur.execute(START_SQL, (user_id, bet, mine_count, mines, SESSION_TTL_SECONDS))
+    row = cur.fetchone()
+    if not row:
+        return None
+    session = MinesSession(row[0], user_id, bet, mine_count, mines, 0, float(row[1]))
+    _cache(session)
+    return session
+
+
+def reveal(cur: Any, user_id: int, cell: int) -> Optional[Dict[str, Any]]:
+    '''Opens one cell. Result has 'finished' set when the board is lost or fully cleared.'''
+    for attempt in range(2):
+        session = load(cur, user_id, refresh=attempt > 0)
+        if session is None:
+            return None
+
+        bit = 1 << cell
+        if session.revealed & bit:
+            return {'isMine': False, 'multiplier': session.multiplier, 'revealed': session.revealed_count,
+                    'finished': False}
+
+        if session.mines & bit:
+            cur.execute(FINISH_SQL, (session.id, session.revealed))
+            if cur.fetchone() is None:
+                continue
+            forget(user_id)
+            return {'isMine': True, 'multiplier': 0.0, 'revealed': session.revealed_count,
+                    'mines': session.mine_cells(), 'finished': True, 'session': session}
+
+        revealed = session.revealed | bit
+        cur.execute(REVEAL_SQL, (revealed, SESSION_TTL_SECONDS, session.id, session.revealed))
+        row = cur.fetchone()
+        if row is None:
+            continue
+        session.revealed = revealed
+        session.revealed_count += 1
+        session.expires_at = float(row[0])
+        return {'isMine': False, 'multiplier': session.multiplier, 'revealed': session.revealed_count,
+                'finished': session.cleared, 'session': session}
+    return None
+
+
+def finish(cur: Any, session: MinesSession) -> bool:
+    '''Closes the session for cashout; False if another request changed or closed it first.'''
+    cur.execute(FINISH_SQL, (session.id, session.revealed))
+    closed = cur.fetchone() is not None
+    forget(session.user_id)
+    return closed
+
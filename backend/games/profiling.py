@@ -0,0 +1,183 @@
+'''
+Business: Opt-in profiling of single handler invocations - cProfile of the Python side plus EXPLAIN ANALYZE of every query
+Args: PROFILE_ACTIONS env (comma-separated actions, or *), or "profile": true in the body of an admin's request
+Returns: the handler's response with an X-Profile-Id header; the artifact is stored gzip-compressed in profile_artifacts
+
+Only the flagged invocation pays for profiling. A "profile": true flag never takes a
+connection of its own: the router verifies the caller with one is_admin lookup on the
+request's own connection (the one admin actions already make) and only then starts
+the profiler through router.profile_hook, so the Python profile covers the action
+itself. Its request cursor records every statement with its parameters
+(metrics.capture_queries); after the handler has returned, each statement is re-run
+under EXPLAIN (ANALYZE, BUFFERS) on a separate connection inside a transaction that
+is always rolled back, so writes, triggers and notifications are undone (sequence
+values are still consumed). Re-running a write really executes it until the
+rollback, so it takes the same row locks as the original, e.g. on a hot users row,
+and concurrent bets of that user wait for the length of the EXPLAIN. The artifact is a
+gzip JSON document with the top functions by cumulative time, the raw pstats data
+(base64 marshal, loadable with pstats/snakeviz) and each query's timing and plan.
+cProfile, pstats and the compression modules are imported on the first profiled
+invocation, so they add nothing to a cold start.
+'''
+
+import json
+import os
+import threading
+import time
+from functools import wraps
+from typing import Any, Callable, Dict, List
+
+import psycopg2
+
+import metrics
+from db import get_db_connection
+from router import parse_body
+
+PROFILE_ACTIONS = frozenset(filter(None, (a.strip() for a in os.environ.get('PROFILE_ACTIONS', '').split(','))))
+MAX_ENV_PROFILES = int(os.environ.get('PROFILE_LIMIT', '20'))
+EXPLAIN_TIMEOUT_MS = int(os.environ.get('PROFILE_EXPLAIN_TIMEOUT_MS', '5000'))
+TOP_FUNCTIONS = 40
+EXPLAINABLE = ('select', 'with', 'insert', 'update', 'delete')
+
+STORE_SQL = '''
+INSERT INTO profile_artifacts (action, user_id, wall_ms, db_ms, artifact)
+VALUES (%s, %s, %s, %s, %s)
+RETURNING id
+'''
+
+# cProfile allows one active profiler per process; concurrent flagged requests run unprofiled
+_lock = threading.Lock()
+_env_profiles = 0
+# Profiler of the current thread's "profile": true request, waiting for the router's admin check
+_pending = threading.local()
+
+
+def _env_requested(action: str) -> bool:
+    global _env_profiles
+    if (action in PROFILE_ACTIONS or '*' in PROFILE_ACTIONS) and _env_profiles < MAX_ENV_PROFILES:
+        _env_profiles += 1
+        return True
+    return False
+
+
+def _start() -> None:
+    '''router.profile_hook: the caller is an admin, so the armed profiler starts now.'''
+    profiler = getattr(_pending, 'profiler', None)
+    if profiler is not None:
+        _pending.profiler = None
+        _pending.started = time.perf_counter()
+        profiler.enable()
+
+
+def explain(captured: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    '''Each captured query with its EXPLAIN (ANALYZE, BUFFERS) plan, run in rolled-back transactions.'''
+    conn = get_db_connection()
+    cur = conn.cursor()
+    queries = []
+    try:
+        for query in captured:
+            sql = query['sql'].decode() if isinstance(query['sql'], bytes) else str(query['sql'])
+            entry = {'sql': sql, 'args': query['args'], 'ms': query['ms'], 'rows': query['rows']}
+            words = sql.split(None, 1)
+            if words and words[0].lower() in EXPLAINABLE:
+                try:
+                    cur.execute(f'SET LOCAL statement_timeout = {EXPLAIN_TIMEOUT_MS}')
+                    cur.execute('EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) ' + sql, query['args'])
+                    entry['plan'] = cur.fetchone()[0]
+                except psycopg2.Error as e:
+                    entry['explain_error'] = str(e).strip()
+                finally:
+                    conn.rollback()
+            queries.append(entry)
+    finally:
+        cur.close()
+        conn.close()
+    return queries
+
+
+def artifact(action: str, wall: float, profiler: Any, captured: List[Dict[str, Any]]) -> bytes:
+    import base64
+    import gzip
+    import io
+    import marshal
+    import pstats
+
+    text = io.StringIO()
+    stats = pstats.Stats(profiler, stream=text)
+    stats.sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+    document = {
+        'action': action,
+        'wall_ms': round(wall * 1000, 3),
+        'db_ms': round(sum(q['ms'] for q in captured), 3),
+        'top_functions': text.getvalue(),
+        'pstats': base64.b64encode(marshal.dumps(stats.stats)).decode(),
+        'queries': explain(captured)
+    }
+    return gzip.compress(json.dumps(document, default=str).encode())
+
+
+def _store(action: str, user_id: Any, wall: float, captured: List[Dict[str, Any]], data: bytes) -> int:
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute(STORE_SQL, (
+            action,
+            user_id if isinstance(user_id, int) else None,
+            round(wall * 1000, 3),
+            round(sum(q['ms'] for q in captured), 3),
+            psycopg2.Binary(data)
+        ))
+        profile_id = cur.fetchone()[0]
+        conn.commit()
+        return profile_id
+    finally:
+        cur.close()
+        conn.close()
+
+
+def profiled(router: Any) -> Callable:
+    '''Handler decorator: profiles invocations requested by PROFILE_ACTIONS or an admin's "profile" flag.'''
+    router.profile_hook = _start
+
+    def decorate(fn: Callable[..., Dict[str, Any]]) -> Callable[..., Dict[str, Any]]:
+        @wraps(fn)
+        def wrapper(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+            action = router.action_name(event)
+            if action in ('-', 'unknown'):
+                return fn(event, context)
+            flagged = parse_body(event).get('profile') is True
+            if not (flagged or _env_requested(action)) or not _lock.acquire(blocking=False):
+                return fn(event, context)
+
+            import cProfile
+
+            captured = metrics.capture_queries()
+            profiler = cProfile.Profile()
+            _pending.started = None
+            if flagged:
+                # Armed only: the router starts it once the caller is verified as an admin
+                _pending.profiler = profiler
+            else:
+                _pending.started = time.perf_counter()
+                profiler.enable()
+            try:
+                response = fn(event, context)
+            finally:
+                profiler.disable()
+                _pending.profiler = None
+                _lock.release()
+            if _pending.started is None:
+                return response
+            wall = time.perf_counter() - _pending.started
+
+            try:
+                data = artifact(action, wall, profiler, captured)
+                profile_id = _store(action, parse_body(event).get('user_id'), wall, captured, data)
+            except psycopg2.Error:
+                return response
+            headers = dict(response.get('headers') or {})
+            headers['X-Profile-Id'] = str(profile_id)
+            headers['Access-Control-Expose-Headers'] = 'X-Profile-Id'
+            return dict(response, headers=headers)
+        return wrapper
+    return decorate
@@ -0,0 +1,246 @@
+'''
+Business: Table-driven action routing and shared JSON responses for the function handlers
+Args: handler event; actions registered with @router.action(name, db=..., admin=..., require=..., fields=...)
+Returns: the action's response, or a 400/403/405 error decided before any action code runs
+
+Each action declares what it needs: required body fields, field types, whether it
+may use the database and whether the caller must be an admin. The request's
+connection is checked out of the pool on first use of req.cur (or on the first
+query through req.lazy_cur, for actions whose cache hits never query), so actions
+that never query never take one, and the router hands it back once the action
+returns. Header dicts are built once and shared, and the body is parsed once per
+request even though the rate limiter and idempotency layer also read it.
+'''
+
+import json
+import math
+import time
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+import metrics
+from db import get_db_connection
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+JSON_HEADERS = {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}
+
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type, X-User-Id, Idempotency-Key',
+    'Access-Control-Max-Age': '86400'
+}
+
+NUMBER = (int, float)
+
+ADMIN_CHECK_SQL = "SELECT is_admin FROM users WHERE id = %s"
+
+PARSED_BODY_KEY = '_parsed_body'
+
+_encoder = json.JSONEncoder(check_circular=False, separators=(',', ':'))
+
+
+def parse_body(event: Dict[str, Any]) -> Any:
+    '''JSON body of the event, parsed once and memoized on the event; raises ValueError.'''
+    body = event.get(PARSED_BODY_KEY)
+    if body is None:
+        body = event[PARSED_BODY_KEY] = json.loads(event.get('body') or '{}')
+    return body
+
+
+def dumps(payload: Any) -> str:
+    if orjson is not None:
+        return orjson.dumps(payload).decode()
+    return _encoder.encode(payload)
+
+
+def respond(payload: Any, status: int = 200) -> Dict[str, Any]:
+    return {'statusCode': status, 'headers': JSON_HEADERS, 'body': dumps(payload)}
+
+
+def respond_raw(body: str, status: int = 200) -> Dict[str, Any]:
+    '''Response around an already serialized JSON body, e.g. one held in a cache.'''
+    return {'statusCode': status, 'headers': JSON_HEADERS, 'body': body}
+
+
+def error(status: int, message: str) -> Dict[str, Any]:
+    return respond({'error': message}, status)
+
+
+PREFLIGHT = {'statusCode': 200, 'headers': CORS_HEADERS, 'body': ''}
+METHOD_NOT_ALLOWED = error(405, 'Method not allowed')
+INVALID_BODY = error(400, 'Invalid JSON body')
+UNKNOWN_ACTION = error(400, 'Unknown action')
+ACCESS_DENIED = error(403, 'Access denied')
+
+
+class LazyCursor:
+    '''Stands in for the request's cursor; the first attribute access checks a connection out.'''
+
+    __slots__ = ('_request',)
+
+    def __init__(self, request: 'Request'):
+        self._request = request
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._request.cursor(), name)
+
+
+class Request:
+    __slots__ = ('event', 'body', 'action', 'user_id', 'lazy_cur', '_db', '_conn', '_cur')
+
+    def __init__(self, event: Dict[str, Any], body: Dict[str, Any], db: bool = True):
+        self.event = event
+        self.body = body
+        self.action = body.get('action')
+        self.user_id = body.get('user_id')
+        self.lazy_cur = LazyCursor(self)
+        self._db = db
+        self._conn = None
+        self._cur = None
+
+    def get(self, name: str, default: Any = None) -> Any:
+        return self.body.get(name, default)
+
+    @property
+    def conn(self) -> Any:
+        if self._conn is None:
+            if not self._db:
+                raise RuntimeError(f'Action {self.action!r} is declared without database access')
+            started = time.perf_counter()
+            self._conn = get_db_connection()
+            metrics.observe_acquire(time.perf_counter() - started)
+        return self._conn
+
+    @property
+    def connected(self) -> bool:
+        return self._conn is not None
+
+    def cursor(self) -> Any:
+        if self._cur is None:
+            self._cur = metrics.traced(self.conn.cursor())
+        return self._cur
+
+    @property
+    def cur(self) -> Any:
+        return self._cur if self._cur is not None else self.cursor()
+
+    def commit(self) -> None:
+        if self._conn is not None:
+            self._conn.commit()
+
+    def rollback(self) -> None:
+        if self._conn is not None:
+            self._conn.rollback()
+
+    def is_admin(self) -> bool:
+        self.cur.execute(ADMIN_CHECK_SQL, (self.user_id,))
+        row = self.cur.fetchone()
+        return bool(row and row[0])
+
+    def close(self) -> None:
+        if self._cur is not None:
+            self._cur.close()
+            self._cur = None
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+class Action:
+    __slots__ = ('fn', 'db', 'admin', 'require', 'fields')
+
+    def __init__(self, fn: Callable[[Request], Dict[str, Any]], db: bool, admin: bool,
+                 require: Tuple[str, ...], fields: Dict[str, Any]):
+        self.fn = fn
+        self.db = db
+        self.admin = admin
+        self.require = require
+        self.fields = fields
+
+
+def _invalid(value: Any, types: Any) -> bool:
+    if isinstance(value, bool):
+        return not (types is bool or isinstance(types, tuple) and bool in types)
+    # json.loads accepts NaN and Infinity (and 1e999 overflows to inf); they would slip past every comparison
+    if isinstance(value, float) and not math.isfinite(value):
+        return True
+    return not isinstance(value, types)
+
+
+class Router:
+    def __init__(self) -> None:
+        self.actions: Dict[str, Action] = {}
+        # Set by profiling.profiled: called once the caller of a "profile": true request is verified as an admin
+        self.profile_hook: Optional[Callable[[], None]] = None
+
+    def action(self, name: str, db: bool = True, admin: bool = False,
+               require: Iterable[str] = ('user_id',), fields: Optional[Dict[str, Any]] = None) -> Callable:
+        '''
+        Registers fn(req) for `name`. require: body fields that must be present and non-empty;
+        fields: {name: type or tuple of types} checked when the field is present.
+        '''
+        def register(fn: Callable[[Request], Dict[str, Any]]) -> Callable[[Request], Dict[str, Any]]:
+            self.actions[name] = Action(fn, db, admin, tuple(require), dict(fields or {}))
+            return fn
+        return register
+
+    def action_name(self, event: Dict[str, Any]) -> str:
+        '''Registered action the event asks for, 'unknown' otherwise and '-' for non-POST requests.'''
+        if event.get('httpMethod') != 'POST':
+            return '-'
+        try:
+            body = parse_body(event)
+        except ValueError:
+            return 'unknown'
+        name = body.get('action') if isinstance(body, dict) else None
+        return name if name in self.actions else 'unknown'
+
+    def validate(self, action: Action, body: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        for name in action.require:
+            if body.get(name) in (None, ''):
+                return error(400, f'Missing {name}')
+        for name, types in action.fields.items():
+            value = body.get(name)
+            if value is not None and _invalid(value, types):
+                return error(400, f'Invalid {name}')
+        return None
+
+    def __call__(self, event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+        method = event.get('httpMethod', 'GET')
+        if method == 'OPTIONS':
+            return PREFLIGHT
+        if method != 'POST':
+            return METHOD_NOT_ALLOWED
+
+        try:
+            body = parse_body(event)
+        except ValueError:
+            return INVALID_BODY
+        if not isinstance(body, dict):
+            return INVALID_BODY
+
+        action = self.actions.get(body.get('action'))
+        if action is None:
+            return UNKNOWN_ACTION
+        invalid = self.validate(action, body)
+        if invalid is not None:
+            return invalid
+
+        request = Request(event, body, action.db)
+        profile = (self.profile_hook is not None and body.get('profile') is True and action.db
+                   and isinstance(request.user_id, int) and not isinstance(request.user_id, bool))
+        try:
+            if action.admin or profile:
+                # One lookup on the request's own connection serves both the admin gate and the profile flag
+                admin = request.is_admin()
+                if action.admin and not admin:
+                    return ACCESS_DENIED
+                if profile and admin:
+                    self.profile_hook()
+            return action.fn(request)
+        finally:
+            request.close()
@@ -0,0 +1,115 @@
+'''
+Business: Odds and payout rules of the mini-games, shared by the handler and the offline simulator
+Args: bet amounts and uniform random draws in [0, 1)
+Returns: round outcomes and payouts; arithmetic only, so NumPy arrays work wherever scalars do
+
+The multipliers are integers, so a cent-quantized Decimal bet gives an exact payout in cents.
+'''
+
+from math import comb
+
+MIN_BETS = {
+    'coinflip': 35,
+    'crash': 10,
+    'mines': 15,
+    'cards': 50
+}
+
+COINFLIP_MULTIPLIER = 2
+COINFLIP_SIDES = ('heads', 'tails')
+
+CARDS_MULTIPLIER = 2
+CARDS_WIN_CHANCE = 0.5
+CARDS_LOWEST = 2
+CARDS_HIGHEST = 14
+
+CRASH_HIGH_ROUND_CHANCE = 0.05
+CRASH_HIGH_ROUND_SPAN = 5
+CRASH_NORMAL_ROUND_SPAN = 3
+CRASH_BETTING_SECONDS = 5
+CRASH_GROWTH_PER_SECOND = 0.1
+CRASH_COOLDOWN_SECONDS = 2
+
+MINES_CELLS = 25
+MINES_DEFAULT_COUNT = 5
+MINES_MIN_COUNT = 1
+MINES_MAX_COUNT = 24
+MINES_HOUSE_EDGE = 0.03
+
+
+def coinflip_side(rand):
+    '''0 for heads, 1 for tails.'''
+    return (rand >= 0.5) * 1
+
+
+def coinflip_payout(amount, won):
+    return amount * COINFLIP_MULTIPLIER * won
+
+
+def cards_won(rand):
+    return rand < CARDS_WIN_CHANCE
+
+
+def cards_dealer_card(rand):
+    return CARDS_LOWEST + (rand * (CARDS_HIGHEST - CARDS_LOWEST + 1)) // 1
+
+
+def cards_payout(amount, won):
+    return amount * CARDS_MULTIPLIER * won
+
+
+def crash_point(rand_kind, rand_point):
+    high = rand_kind < CRASH_HIGH_ROUND_CHANCE
+    span = CRASH_NORMAL_ROUND_SPAN + (CRASH_HIGH_ROUND_SPAN - CRASH_NORMAL_ROUND_SPAN) * high
+    return 1 + rand_point * span
+
+
+def crash_payout(amount, cashout_at, point):
+    return amount * cashout_at * (cashout_at < point)
+
+
+def crash_point_cents(rand_kind, rand_point):
+    '''crash_point floored to whole hundredths, as stored and settled.'''
+    return (crash_point(rand_kind, rand_point) * 100) // 1 / 100
+
+
+def crash_point_from_hash(round_hash: str) -> float:
+    '''Crash point of a hash-chain round: two 52-bit uniforms taken from the hash.'''
+    rand_kind = int(round_hash[:13], 16) / 2 ** 52
+    rand_point = int(round_hash[13:26], 16) / 2 ** 52
+    return crash_point_cents(rand_kind, rand_point)
+
+
+def crash_multiplier_at(elapsed: float) -> float:
+    return 1 + max(elapsed, 0) * CRASH_GROWTH_PER_SECOND
+
+
+def crash_flight_seconds(point: float) -> float:
+    return (point - 1) / CRASH_GROWTH_PER_SECOND
+
+
+def mines_survival(mines: int, revealed: int) -> float:
+    '''Chance that the first `revealed` picks all miss the mines.'''
+    return comb(MINES_CELLS - mines, revealed) / comb(MINES_CELLS, revealed)
+
+
+def _mines_multiplier_table():
+    table = [[]]
+    for mines in range(MINES_MIN_COUNT, MINES_MAX_COUNT + 1):
+        table.append([1.0] + [
+            int((1 - MINES_HOUSE_EDGE) / mines_survival(mines, revealed) * 100) / 100
+            for revealed in range(1, MINES_CELLS - mines + 1)
+        ])
+    return table
+
+
+# MINES_MULTIPLIERS[mines][revealed]: fair odds minus the house edge, floored to hundredths
+MINES_MULTIPLIERS = _mines_multiplier_table()
+
+
+def mines_multiplier(mines: int, revealed: int) -> float:
+    return MINES_MULTIPLIERS[mines][revealed]
+
+
+def mines_payout(amount, mines: int, revealed: int, survived):
+    return amount * MINES_MULTIPLIERS[mines][revealed] * survived
@@ -0,0 +1,126 @@
+-- Running totals for the admin dashboard, maintained by triggers in the same
+-- transaction as every user registration, balance change and case opening.
+-- Totals are spread over 16 shards (user_id % 16) so concurrent bets from
+-- different users do not queue on one hot row; readers sum the shards.
+
+CREATE TABLE IF NOT EXISTS casino_stats (
+  shard SMALLINT PRIMARY KEY,
+  total_users BIGINT NOT NULL DEFAULT 0,
+  total_balance DECIMAL(18, 2) NOT NULL DEFAULT 0,
+  total_cases_opened BIGINT NOT NULL DEFAULT 0,
+  total_winnings DECIMAL(18, 2) NOT NULL DEFAULT 0,
+  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO casino_stats (shard)
+SELECT generate_series(0, 15)
+ON CONFLICT (shard) DO NOTHING;
+
+CREATE OR REPLACE FUNCTION casino_stats_users_insert() RETURNS TRIGGER AS $$
+BEGIN
+  UPDATE casino_stats s
+  SET total_users = s.total_users + d.users,
+      total_balance = s.total_balance + d.balance,
+      updated_at = CURRENT_TIMESTAMP
+  FROM (
+    SELECT id % 16 AS shard, COUNT(*) AS users, COALESCE(SUM(balance), 0) AS balance
+    FROM new_rows GROUP BY id % 16
+  ) d
+  WHERE s.shard = d.shard;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION casino_stats_users_update() RETURNS TRIGGER AS $$
+BEGIN
+  UPDATE casino_stats s
+  SET total_balance = s.total_balance + d.balance,
+      updated_at = CURRENT_TIMESTAMP
+  FROM (
+    SELECT n.id % 16 AS shard, SUM(COALESCE(n.balance, 0) - COALESCE(o.balance, 0)) AS balance
+    FROM new_rows n JOIN old_rows o ON o.id = n.id
+    WHERE n.balance IS DISTINCT FROM o.balance
+    GROUP BY n.id % 16
+  ) d
+  WHERE s.shard = d.shard;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION casino_stats_users_delete() RETURNS TRIGGER AS $$
+BEGIN
+  UPDATE casino_stats s
+  SET total_users = s.total_users - d.users,
+      total_balance = s.total_balance - d.balance,
+      updated_at = CURRENT_TIMESTAMP
+  FROM (
+    SELECT id % 16 AS shard, COUNT(*) AS users, COALESCE(SUM(balance), 0) AS balance
+    FROM old_rows GROUP BY id % 16
+  ) d
+  WHERE s.shard = d.shard;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION casino_stats_case_openings_insert() RETURNS TRIGGER AS $$
+BEGIN
+  UPDATE casino_stats s
+  SET total_cases_opened = s.total_cases_opened + d.cases,
+      total_winnings = s.total_winnings + d.winnings,
+      updated_at = CURRENT_TIMESTAMP
+  FROM (
+    SELECT COALESCE(user_id, 0) % 16 AS shard, COUNT(*) AS cases, SUM(prize_amount) AS winnings
+    FROM new_rows GROUP BY COALESCE(user_id, 0) % 16
+  ) d
+  WHERE s.shard = d.shard;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS casino_stats_users_insert ON users;
+CREATE TRIGGER casino_stats_users_insert
+  AFTER INSERT ON users REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION casino_stats_users_insert();
+
+DROP TRIGGER IF EXISTS casino_stats_users_update ON users;
+CREATE TRIGGER casino_stats_users_update
+  AFTER UPDATE ON users REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION casino_stats_users_update();
+
+DROP TRIGGER IF EXISTS casino_stats_users_delete ON users;
+CREATE TRIGGER casino_stats_users_delete
+  AFTER DELETE ON users REFERENCING OLD TABLE AS old_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION casino_stats_users_delete();
+
+DROP TRIGGER IF EXISTS casino_stats_case_openings_insert ON case_openings;
+CREATE TRIGGER casino_stats_case_openings_insert
+  AFTER INSERT ON case_openings REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION casino_stats_case_openings_insert();
+
+-- Rebuilds every shard from the raw tables; used for the initial backfill and
+-- by tools/reconcile_stats.py. Locks the counters so no trigger update is lost.
+CREATE OR REPLACE FUNCTION reconcile_casino_stats() RETURNS VOID AS $$
+BEGIN
+  LOCK TABLE casino_stats IN EXCLUSIVE MODE;
+  LOCK TABLE users, case_openings IN SHARE MODE;
+
+  UPDATE casino_stats s
+  SET total_users = COALESCE(u.users, 0),
+      total_balance = COALESCE(u.balance, 0),
+      total_cases_opened = COALESCE(c.cases, 0),
+      total_winnings = COALESCE(c.winnings, 0),
+      updated_at = CURRENT_TIMESTAMP
+  FROM generate_series(0, 15) AS g(shard)
+  LEFT JOIN (
+    SELECT id % 16 AS shard, COUNT(*) AS users, COALESCE(SUM(balance), 0) AS balance
+    FROM users GROUP BY id % 16
+  ) u ON u.shard = g.shard
+  LEFT JOIN (
+    SELECT COALESCE(user_id, 0) % 16 AS shard, COUNT(*) AS cases, COALESCE(SUM(prize_amount), 0) AS winnings
+    FROM case_openings GROUP BY COALESCE(user_id, 0) % 16
+  ) c ON c.shard = g.shard
+  WHERE s.shard = g.shard;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT reconcile_casino_stats();
@@ -0,0 +1,10 @@
+-- Supports keyset pagination and filters of admin get_users.
+
+UPDATE users SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL;
+ALTER TABLE users ALTER COLUMN created_at SET NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_users_created_at_id ON users (created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_users_admins_created_at_id ON users (created_at DESC, id DESC) WHERE is_admin;
+CREATE INDEX IF NOT EXISTS idx_users_email_prefix ON users (lower(email) text_pattern_ops);
+CREATE INDEX IF NOT EXISTS idx_users_name_prefix ON users (lower(name) text_pattern_ops);
+CREATE INDEX IF NOT EXISTS idx_users_balance ON users (balance);
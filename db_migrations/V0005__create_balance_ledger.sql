@@ -0,0 +1,36 @@
+-- Append-only history of every balance change, written by the handlers in the
+-- same transaction as the change itself. Range-partitioned by month so old
+-- months can be detached and dropped instead of deleted row by row.
+
+CREATE TABLE IF NOT EXISTS balance_ledger (
+  id BIGSERIAL,
+  user_id INTEGER NOT NULL,
+  game VARCHAR(50) NOT NULL,
+  bet DECIMAL(12, 2) NOT NULL DEFAULT 0,
+  payout DECIMAL(12, 2) NOT NULL DEFAULT 0,
+  delta DECIMAL(12, 2) NOT NULL,
+  balance_after DECIMAL(12, 2) NOT NULL,
+  reference VARCHAR(100),
+  created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+CREATE INDEX IF NOT EXISTS idx_balance_ledger_user_created ON balance_ledger (user_id, created_at DESC);
+
+CREATE TABLE IF NOT EXISTS balance_ledger_default PARTITION OF balance_ledger DEFAULT;
+
+CREATE OR REPLACE FUNCTION create_balance_ledger_partition(month DATE) RETURNS TEXT AS $$
+DECLARE
+  start_at DATE := date_trunc('month', month)::DATE;
+  partition_name TEXT := 'balance_ledger_' || to_char(start_at, 'YYYY_MM');
+BEGIN
+  EXECUTE format(
+    'CREATE TABLE IF NOT EXISTS %I PARTITION OF balance_ledger FOR VALUES FROM (%L) TO (%L)',
+    partition_name, start_at, (start_at + INTERVAL '1 month')::DATE
+  );
+  RETURN partition_name;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT create_balance_ledger_partition((date_trunc('month', CURRENT_DATE) + make_interval(months => m))::DATE)
+FROM generate_series(0, 12) AS m;
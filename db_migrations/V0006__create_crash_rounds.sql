@@ -0,0 +1,31 @@
+-- Server-side Crash: one precomputed timeline of rounds shared by all players.
+-- Rounds are generated ahead of time from a SHA-256 hash chain by
+-- tools/crash_chain.py; a round's hash and crash_point are only revealed after
+-- it has crashed.
+
+CREATE TABLE IF NOT EXISTS crash_rounds (
+  id BIGINT PRIMARY KEY,
+  hash CHAR(64) UNIQUE NOT NULL,
+  crash_point DECIMAL(10, 2) NOT NULL,
+  betting_opens_at TIMESTAMPTZ NOT NULL,
+  starts_at TIMESTAMPTZ NOT NULL,
+  crashes_at TIMESTAMPTZ NOT NULL,
+  settled_at TIMESTAMPTZ
+);
+
+CREATE INDEX IF NOT EXISTS idx_crash_rounds_starts_at ON crash_rounds (starts_at);
+CREATE INDEX IF NOT EXISTS idx_crash_rounds_crashes_at ON crash_rounds (crashes_at);
+CREATE INDEX IF NOT EXISTS idx_crash_rounds_unsettled ON crash_rounds (id) WHERE settled_at IS NULL;
+
+CREATE TABLE IF NOT EXISTS crash_bets (
+  round_id BIGINT NOT NULL REFERENCES crash_rounds(id),
+  user_id INTEGER NOT NULL REFERENCES users(id),
+  amount DECIMAL(10, 2) NOT NULL,
+  auto_cashout DECIMAL(10, 2),
+  cashout_at DECIMAL(10, 2),
+  payout DECIMAL(12, 2),
+  placed_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (round_id, user_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_crash_bets_user ON crash_bets (user_id, round_id DESC);
@@ -0,0 +1,13 @@
+-- One in-progress Mines board per user. Boards are 25-bit masks: bit n set in
+-- mines_mask means cell n holds a mine, in revealed_mask that it was opened.
+
+CREATE TABLE IF NOT EXISTS mines_sessions (
+  id BIGSERIAL PRIMARY KEY,
+  user_id INTEGER UNIQUE NOT NULL REFERENCES users(id),
+  bet DECIMAL(10, 2) NOT NULL,
+  mine_count SMALLINT NOT NULL CHECK (mine_count BETWEEN 1 AND 24),
+  mines_mask INTEGER NOT NULL,
+  revealed_mask INTEGER NOT NULL DEFAULT 0,
+  expires_at TIMESTAMPTZ NOT NULL,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
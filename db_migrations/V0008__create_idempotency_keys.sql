@@ -0,0 +1,21 @@
+-- Responses of mutating actions keyed by the client's Idempotency-Key, so a
+-- retried request replays the first result instead of running again.
+-- status_code/response stay NULL while the first attempt is still running
+-- (for at most the lease added by V0015). Keys are only claimed for actions
+-- of a real user (login is not keyed); no FK on purpose.
+-- Claims and responses are written outside the action's transaction: a crash
+-- between the action's commit and storing its response leaves the key to be
+-- taken over after the lease, and that retry runs the action again.
+
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+  user_id INTEGER NOT NULL,
+  key VARCHAR(128) NOT NULL,
+  action VARCHAR(50) NOT NULL,
+  status_code SMALLINT,
+  response JSONB,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  expires_at TIMESTAMPTZ NOT NULL,
+  PRIMARY KEY (user_id, key)
+);
+
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires_at ON idempotency_keys (expires_at);
@@ -0,0 +1,12 @@
+-- Shared token buckets for RATE_LIMIT_BACKEND=postgres: one row per user and
+-- action, refilled lazily by the UPSERT in ratelimit.py. Rows are tiny and
+-- idle ones are simply full buckets, so pruning is optional:
+--   DELETE FROM rate_limit_buckets WHERE updated_at < now() - INTERVAL '1 hour';
+
+CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+  user_id INTEGER NOT NULL,
+  action VARCHAR(50) NOT NULL,
+  tokens DOUBLE PRECISION NOT NULL,
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (user_id, action)
+);
@@ -0,0 +1,5 @@
+-- login is a single INSERT ... ON CONFLICT (google_id) DO UPDATE; the update
+-- branch records the login time instead of rewriting an unchanged column.
+-- google_id (the phone number) is already covered by its UNIQUE index.
+
+ALTER TABLE users ADD COLUMN IF NOT EXISTS last_login_at TIMESTAMPTZ;
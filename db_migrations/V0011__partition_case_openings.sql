@@ -0,0 +1,60 @@
+-- case_openings is the fastest-growing table. Rebuild it range-partitioned by
+-- month (same scheme as balance_ledger) with an index for per-user history:
+-- get_history walks (user_id, opened_at DESC, id DESC) with keyset pagination,
+-- and a cursor's opened_at lets the planner skip newer months entirely.
+-- Existing ids are kept and the sequence moves to the new table as BIGINT.
+
+ALTER TABLE case_openings RENAME TO case_openings_unpartitioned;
+ALTER SEQUENCE case_openings_id_seq OWNED BY NONE;
+ALTER SEQUENCE case_openings_id_seq AS BIGINT;
+
+CREATE TABLE case_openings (
+  id BIGINT NOT NULL DEFAULT nextval('case_openings_id_seq'),
+  user_id INTEGER REFERENCES users(id),
+  case_name VARCHAR(100) NOT NULL,
+  case_price DECIMAL(10, 2) NOT NULL,
+  prize_amount DECIMAL(10, 2) NOT NULL,
+  opened_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (id, opened_at)
+) PARTITION BY RANGE (opened_at);
+
+ALTER SEQUENCE case_openings_id_seq OWNED BY case_openings.id;
+
+CREATE INDEX IF NOT EXISTS idx_case_openings_user_opened ON case_openings (user_id, opened_at DESC, id DESC);
+
+CREATE TABLE IF NOT EXISTS case_openings_default PARTITION OF case_openings DEFAULT;
+
+CREATE OR REPLACE FUNCTION create_case_openings_partition(month DATE) RETURNS TEXT AS $$
+DECLARE
+  start_at DATE := date_trunc('month', month)::DATE;
+  partition_name TEXT := 'case_openings_' || to_char(start_at, 'YYYY_MM');
+BEGIN
+  EXECUTE format(
+    'CREATE TABLE IF NOT EXISTS %I PARTITION OF case_openings FOR VALUES FROM (%L) TO (%L)',
+    partition_name, start_at, (start_at + INTERVAL '1 month')::DATE
+  );
+  RETURN partition_name;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Every month that already has openings, through 12 months ahead
+SELECT create_case_openings_partition(month::DATE)
+FROM generate_series(
+  date_trunc('month', LEAST(
+    (SELECT MIN(opened_at) FROM case_openings_unpartitioned), CURRENT_TIMESTAMP::TIMESTAMP
+  )),
+  date_trunc('month', CURRENT_DATE) + INTERVAL '12 months',
+  INTERVAL '1 month'
+) AS month;
+
+-- Copied before the stats trigger exists, so casino_stats is not counted twice
+INSERT INTO case_openings (id, user_id, case_name, case_price, prize_amount, opened_at)
+SELECT id, user_id, case_name, case_price, prize_amount, COALESCE(opened_at, CURRENT_TIMESTAMP)
+FROM case_openings_unpartitioned;
+
+DROP TABLE case_openings_unpartitioned;
+
+DROP TRIGGER IF EXISTS casino_stats_case_openings_insert ON case_openings;
+CREATE TRIGGER casino_stats_case_openings_insert
+  AFTER INSERT ON case_openings REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION casino_stats_case_openings_insert();
@@ -0,0 +1,54 @@
+-- Per-user, per-day rollup of bets for the public leaderboard, maintained by a
+-- statement-level trigger on balance_ledger in the same transaction as each
+-- settlement, so leaderboard reads never scan history. Promo credits and admin
+-- edits are not play and are left out.
+
+CREATE TABLE IF NOT EXISTS leaderboard_daily (
+  day DATE NOT NULL,
+  user_id INTEGER NOT NULL,
+  rounds BIGINT NOT NULL DEFAULT 0,
+  wagered DECIMAL(18, 2) NOT NULL DEFAULT 0,
+  paid DECIMAL(18, 2) NOT NULL DEFAULT 0,
+  net DECIMAL(18, 2) NOT NULL DEFAULT 0,
+  biggest_win DECIMAL(12, 2) NOT NULL DEFAULT 0,
+  biggest_win_game VARCHAR(50),
+  PRIMARY KEY (day, user_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_leaderboard_daily_day_net ON leaderboard_daily (day, net DESC);
+CREATE INDEX IF NOT EXISTS idx_leaderboard_daily_day_win ON leaderboard_daily (day, biggest_win DESC);
+
+CREATE OR REPLACE FUNCTION leaderboard_daily_ledger_insert() RETURNS TRIGGER AS $$
+BEGIN
+  INSERT INTO leaderboard_daily AS l (day, user_id, rounds, wagered, paid, net, biggest_win, biggest_win_game)
+  SELECT created_at::DATE, user_id, COUNT(*), SUM(bet), SUM(payout), SUM(payout - bet),
+         MAX(payout), (array_agg(game ORDER BY payout DESC))[1]
+  FROM new_rows
+  WHERE game NOT IN ('promo', 'admin')
+  GROUP BY created_at::DATE, user_id
+  ORDER BY 1, 2
+  ON CONFLICT (day, user_id) DO UPDATE
+  SET rounds = l.rounds + EXCLUDED.rounds,
+      wagered = l.wagered + EXCLUDED.wagered,
+      paid = l.paid + EXCLUDED.paid,
+      net = l.net + EXCLUDED.net,
+      biggest_win = GREATEST(l.biggest_win, EXCLUDED.biggest_win),
+      biggest_win_game = CASE WHEN EXCLUDED.biggest_win > l.biggest_win
+                              THEN EXCLUDED.biggest_win_game ELSE l.biggest_win_game END;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Backfill from the existing ledger before the trigger starts counting
+INSERT INTO leaderboard_daily (day, user_id, rounds, wagered, paid, net, biggest_win, biggest_win_game)
+SELECT created_at::DATE, user_id, COUNT(*), SUM(bet), SUM(payout), SUM(payout - bet),
+       MAX(payout), (array_agg(game ORDER BY payout DESC))[1]
+FROM balance_ledger
+WHERE game NOT IN ('promo', 'admin')
+GROUP BY created_at::DATE, user_id
+ON CONFLICT (day, user_id) DO NOTHING;
+
+DROP TRIGGER IF EXISTS leaderboard_daily_ledger_insert ON balance_ledger;
+CREATE TRIGGER leaderboard_daily_ledger_insert
+  AFTER INSERT ON balance_ledger REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION leaderboard_daily_ledger_insert();
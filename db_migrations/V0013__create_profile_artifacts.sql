@@ -0,0 +1,16 @@
+-- Profiles captured by profiling.py: a gzip JSON document per profiled handler
+-- invocation (cProfile stats plus EXPLAIN ANALYZE of each query it ran).
+-- Written only for invocations flagged via PROFILE_ACTIONS or an admin's
+-- "profile" request flag; read back through the admin get_profile action.
+
+CREATE TABLE IF NOT EXISTS profile_artifacts (
+  id BIGSERIAL PRIMARY KEY,
+  action VARCHAR(50) NOT NULL,
+  user_id INTEGER,
+  wall_ms NUMERIC(12, 3) NOT NULL,
+  db_ms NUMERIC(12, 3) NOT NULL,
+  artifact BYTEA NOT NULL,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_profile_artifacts_created_at ON profile_artifacts (created_at);
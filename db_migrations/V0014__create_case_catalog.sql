@@ -0,0 +1,62 @@
+-- Case catalog edited through the admin function instead of a redeploy.
+-- The game function keeps a compiled copy (alias tables) in memory and re-reads
+-- it only when case_catalog.version has moved; statement-level triggers bump the
+-- version in the same transaction as every change to cases or case_prizes.
+-- Inactive cases stay in the table so past openings keep their meaning.
+
+CREATE TABLE IF NOT EXISTS cases (
+  id VARCHAR(50) PRIMARY KEY,
+  name VARCHAR(100) NOT NULL,
+  price DECIMAL(12, 2) NOT NULL CHECK (price > 0),
+  active BOOLEAN NOT NULL DEFAULT TRUE,
+  sort_order INTEGER NOT NULL DEFAULT 0,
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS case_prizes (
+  id SERIAL PRIMARY KEY,
+  case_id VARCHAR(50) NOT NULL REFERENCES cases (id) ON DELETE CASCADE,
+  amount DECIMAL(12, 2) NOT NULL CHECK (amount >= 0),
+  chance DOUBLE PRECISION NOT NULL CHECK (chance >= 0)
+);
+
+CREATE INDEX IF NOT EXISTS idx_case_prizes_case_id ON case_prizes (case_id);
+
+CREATE TABLE IF NOT EXISTS case_catalog (
+  singleton BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (singleton),
+  version BIGINT NOT NULL DEFAULT 1
+);
+
+INSERT INTO case_catalog DEFAULT VALUES ON CONFLICT DO NOTHING;
+
+CREATE OR REPLACE FUNCTION bump_case_catalog_version() RETURNS TRIGGER AS $$
+BEGIN
+  UPDATE case_catalog SET version = version + 1;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS cases_bump_catalog_version ON cases;
+CREATE TRIGGER cases_bump_catalog_version
+  AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON cases
+  FOR EACH STATEMENT EXECUTE FUNCTION bump_case_catalog_version();
+
+DROP TRIGGER IF EXISTS case_prizes_bump_catalog_version ON case_prizes;
+CREATE TRIGGER case_prizes_bump_catalog_version
+  AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON case_prizes
+  FOR EACH STATEMENT EXECUTE FUNCTION bump_case_catalog_version();
+
+-- Seed with the catalog that used to be hard-coded in backend/game/cases.py
+INSERT INTO cases (id, name, price, sort_order) VALUES
+  ('bomj', 'Бомж', 30.00, 1),
+  ('rich', 'Богатый', 560.00, 2)
+ON CONFLICT (id) DO NOTHING;
+
+INSERT INTO case_prizes (case_id, amount, chance)
+SELECT v.case_id, v.amount, v.chance
+FROM (VALUES
+  ('bomj', 100, 50), ('bomj', 200, 24), ('bomj', 250, 23), ('bomj', 300, 20),
+  ('rich', 350, 75), ('rich', 400, 50), ('rich', 1200, 11), ('rich', 3000, 10), ('rich', 15000, 0.0001)
+) AS v (case_id, amount, chance)
+WHERE NOT EXISTS (SELECT 1 FROM case_prizes p WHERE p.case_id = v.case_id)
+ORDER BY v.case_id, v.amount;
@@ -0,0 +1,4 @@
+-- In-progress idempotency claims are leased: once locked_until has passed without a
+-- stored response (the invocation was killed or timed out), a retry may take the key over.
+-- Claims that exist when this runs get an already short lease.
+ALTER TABLE idempotency_keys ADD COLUMN IF NOT EXISTS locked_until TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP;
@@ -0,0 +1,38 @@
+-- V0012 ranked gross payout as the biggest win, so a case opening worth less than
+-- its price counted as a "win", and counted every ledger row as a round, so Crash
+-- and Mines (a bet row, then a separate payout row) were counted twice.
+-- A win is now payout - bet where payout > bet, and a round is a row with bet > 0.
+-- The rollup is rebuilt from the ledger; TRUNCATE holds off the trigger of
+-- concurrent settlements until the rebuild commits, so none is lost or doubled.
+
+CREATE OR REPLACE FUNCTION leaderboard_daily_ledger_insert() RETURNS TRIGGER AS $$
+BEGIN
+  INSERT INTO leaderboard_daily AS l (day, user_id, rounds, wagered, paid, net, biggest_win, biggest_win_game)
+  SELECT created_at::DATE, user_id, COUNT(*) FILTER (WHERE bet > 0), SUM(bet), SUM(payout), SUM(payout - bet),
+         COALESCE(MAX(payout - bet) FILTER (WHERE payout > bet), 0),
+         (array_agg(game ORDER BY payout - bet DESC) FILTER (WHERE payout > bet))[1]
+  FROM new_rows
+  WHERE game NOT IN ('promo', 'admin')
+  GROUP BY created_at::DATE, user_id
+  ORDER BY 1, 2
+  ON CONFLICT (day, user_id) DO UPDATE
+  SET rounds = l.rounds + EXCLUDED.rounds,
+      wagered = l.wagered + EXCLUDED.wagered,
+      paid = l.paid + EXCLUDED.paid,
+      net = l.net + EXCLUDED.net,
+      biggest_win = GREATEST(l.biggest_win, EXCLUDED.biggest_win),
+      biggest_win_game = CASE WHEN EXCLUDED.biggest_win > l.biggest_win
+                              THEN EXCLUDED.biggest_win_game ELSE l.biggest_win_game END;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+TRUNCATE leaderboard_daily;
+
+INSERT INTO leaderboard_daily (day, user_id, rounds, wagered, paid, net, biggest_win, biggest_win_game)
+SELECT created_at::DATE, user_id, COUNT(*) FILTER (WHERE bet > 0), SUM(bet), SUM(payout), SUM(payout - bet),
+       COALESCE(MAX(payout - bet) FILTER (WHERE payout > bet), 0),
+       (array_agg(game ORDER BY payout - bet DESC) FILTER (WHERE payout > bet))[1]
+FROM balance_ledger
+WHERE game NOT IN ('promo', 'admin')
+GROUP BY created_at::DATE, user_id;
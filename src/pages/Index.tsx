@@ -240,7 +240,7 @@ export default function Index() {
 
     if (usersRes.ok) {
       const usersData = await usersRes.json();
-      setUsers(usersData);
+      setUsers(usersData.users);
     }
   };
 
@@ -0,0 +1,331 @@
+'''
+Business: In-process load test and latency benchmark of every backend function handler
+Args: DATABASE_URL env (local PostgreSQL); --mix, --requests, --concurrency, --setup, --save/--compare baselines
+Returns: p50/p95/p99 latency, requests per second and queries per request for each action
+
+Calls handler(event, context) from backend/*/index.py directly, so the numbers cover
+the Python code, the connection pool and the database but not the gateway.
+
+    createdb casino_bench
+    export DATABASE_URL=postgres://localhost/casino_bench
+    python tools/bench.py --setup --requests 20000 --concurrency 16 --save bench/baseline.json
+    python tools/bench.py --requests 20000 --concurrency 16 --compare bench/baseline.json
+'''
+
+import argparse
+import glob
+import json
+import os
+import random
+import secrets
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Tuple
+
+import psycopg2
+import psycopg2.extensions
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from functions import load_function_module
+from crash_chain import append_rounds, build_chain
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MIGRATIONS_DIR = os.path.join(ROOT_DIR, 'db_migrations')
+
+DEFAULT_MIX = 'login=5,get_user=40,open_case=15,coinflip=25,crash_bet=5,crash_cashout=5,get_stats=5'
+ACTION_FUNCTIONS = {
+    'login': 'auth',
+    'get_user': 'auth',
+    'open_case': 'game',
+    'coinflip': 'games',
+    'crash_bet': 'games',
+    'crash_cashout': 'games',
+    'get_stats': 'admin'
+}
+BENCH_PHONE_PREFIX = '7000'
+# The bench users fire far more than a player could; the buckets are still checked, but never reject
+BENCH_RATE_LIMITS = ','.join(f'{action}=1000000/1000000' for action in (
+    'open_case', 'use_promo', 'get_history', 'coinflip', 'cards', 'crash_bet', 'crash_cashout',
+    'crash_state', 'mines_bet', 'mines_reveal', 'mines_cashout', 'autobet'
+))
+REGRESSION_TOLERANCE = 1.2
+
+_queries = threading.local()
+
+
+class CountingCursor(psycopg2.extensions.cursor):
+    def execute(self, query: Any, vars: Any = None) -> Any:
+        _queries.count = getattr(_queries, 'count', 0) + 1
+        if 'pg_notify' in str(query):
+            # The post-commit profile cache eviction (settlement.announces_balances), not part of the action
+            _queries.announces = getattr(_queries, 'announces', 0) + 1
+        return super().execute(query, vars)
+
+
+def install_query_counter() -> None:
+    '''Every connection the handlers' pools open gets a cursor that counts executed statements.'''
+    connect = psycopg2.connect
+
+    def counting_connect(*args: Any, **kwargs: Any) -> Any:
+        kwargs.setdefault('cursor_factory', CountingCursor)
+        return connect(*args, **kwargs)
+
+    psycopg2.connect = counting_connect
+
+
+def apply_migrations(conn: Any) -> None:
+    cur = conn.cursor()
+    for path in sorted(glob.glob(os.path.join(MIGRATIONS_DIR, 'V*.sql'))):
+        with open(path, encoding='utf-8') as f:
+            cur.execute(f.read())
+        print('applied', os.path.basename(path))
+    conn.commit()
+    cur.close()
+
+
+def seed(conn: Any, users: int) -> List[int]:
+    cur = conn.cursor()
+    cur.execute(
+        "INSERT INTO users (google_id, email, name, balance) "
+        "SELECT %s || n, %s || n || '@bench.user', 'Bench' || n, 1000000 FROM generate_series(1, %s) n "
+        "ON CONFLICT (google_id) DO NOTHING",
+        (BENCH_PHONE_PREFIX, BENCH_PHONE_PREFIX, users)
+    )
+    cur.execute("UPDATE users SET balance = 1000000 WHERE google_id LIKE %s", (BENCH_PHONE_PREFIX + '%',))
+    cur.execute("SELECT id FROM users WHERE google_id LIKE %s ORDER BY id", (BENCH_PHONE_PREFIX + '%',))
+    ids = [row[0] for row in cur.fetchall()]
+    cur.execute("UPDATE users SET is_admin = TRUE WHERE id = %s", (ids[0],))
+    conn.commit()
+    cur.close()
+    return ids
+
+
+def ensure_crash_rounds(conn: Any) -> None:
+    cur = conn.cursor()
+    cur.execute("SELECT COUNT(*) FROM crash_rounds WHERE starts_at > clock_timestamp()")
+    upcoming = cur.fetchone()[0]
+    cur.close()
+    if upcoming < 100:
+        append_rounds(conn, build_chain(secrets.token_hex(32), 2000))
+
+
+def parse_mix(mix: str) -> Tuple[List[str], List[float]]:
+    actions, weights = [], []
+    for part in mix.split(','):
+        action, weight = part.split('=')
+        if action not in ACTION_FUNCTIONS:
+            raise SystemExit(f'unknown action in mix: {action}')
+        actions.append(action)
+        weights.append(float(weight))
+    return actions, weights
+
+
+def build_body(action: str, user_ids: List[int], admin_id: int) -> Dict[str, Any]:
+    user_id = random.choice(user_ids)
+    if action == 'login':
+        return {'action': 'login', 'phone_number': f'{BENCH_PHONE_PREFIX}{random.randint(1, len(user_ids))}', 'code': '1234'}
+    if action == 'open_case':
+        return {'action': 'open_case', 'user_id': user_id, 'case_id': 'bomj'}
+    if action == 'coinflip':
+        return {'action': 'coinflip', 'user_id': user_id, 'amount': 35, 'choice': random.choice(('heads', 'tails'))}
+    if action == 'crash_bet':
+        return {'action': 'crash_bet', 'user_id': user_id, 'amount': 10}
+    if action == 'get_stats':
+        return {'action': 'get_stats', 'user_id': admin_id}
+    return {'action': action, 'user_id': user_id}
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(int(round(q / 100.0 * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def run(handlers: Dict[str, Callable], actions: List[str], weights: List[float], requests: int,
+        concurrency: int, user_ids: List[int]) -> Dict[str, Any]:
+    plan = random.choices(actions, weights=weights, k=requests)
+    samples: Dict[str, List[Tuple[float, int, int]]] = {action: [] for action in actions}
+    lock = threading.Lock()
+
+    def invoke(action: str) -> None:
+        event = {'httpMethod': 'POST', 'body': json.dumps(build_body(action, user_ids, user_ids[0]))}
+        _queries.count = 0
+        started = time.perf_counter()
+        response = handlers[ACTION_FUNCTIONS[action]](event, None)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with lock:
+            samples[action].append((elapsed_ms, response['statusCode'], _queries.count))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(invoke, plan))
+    wall = time.perf_counter() - started
+
+    report = {'requests': requests, 'concurrency': concurrency, 'wall_s': wall, 'rps': requests / wall, 'actions': {}}
+    for action, rows in samples.items():
+        latencies = sorted(r[0] for r in rows)
+        report['actions'][action] = {
+            'count': len(rows),
+            'errors': sum(1 for r in rows if r[1] >= 400),
+            'rps': len(rows) / wall,
+            'p50_ms': percentile(latencies, 50),
+            'p95_ms': percentile(latencies, 95),
+            'p99_ms': percentile(latencies, 99),
+            'queries_per_request': sum(r[2] for r in rows) / len(rows) if rows else 0.0
+        }
+    return report
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    header = f"{'action':<15}{'count':>8}{'errors':>8}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'q/req':>7}"
+    print(header)
+    print('-' * len(header))
+    for action, r in report['actions'].items():
+        print(
+            f"{action:<15}{r['count']:>8}{r['errors']:>8}{r['rps']:>9.1f}{r['p50_ms']:>9.2f}"
+            f"{r['p95_ms']:>9.2f}{r['p99_ms']:>9.2f}{r['queries_per_request']:>7.1f}"
+        )
+    print(f"\n{report['requests']} requests, concurrency {report['concurrency']}: "
+          f"{report['rps']:.1f} req/s over {report['wall_s']:.1f}s")
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any]) -> List[str]:
+    regressions = []
+    for action, r in report['actions'].items():
+        base = baseline['actions'].get(action)
+        if not base or not base['count']:
+            continue
+        if r['p95_ms'] > base['p95_ms'] * REGRESSION_TOLERANCE:
+            regressions.append(f"{action}: p95 {base['p95_ms']:.2f} -> {r['p95_ms']:.2f} ms")
+        if r['queries_per_request'] > base['queries_per_request'] + 0.01:
+            regressions.append(
+                f"{action}: queries/request {base['queries_per_request']:.2f} -> {r['queries_per_request']:.2f}"
+            )
+    return regressions
+
+
+def promo_burst(handler: Callable, conn: Any, user_ids: List[int], burst: int, max_uses: int,
+                concurrency: int) -> bool:
+    '''
+    Fires `burst` concurrent redemptions of one fresh code and checks the limit held exactly
+    and that every redemption was a single statement (the post-commit cache eviction aside).
+    '''
+    code = f'bench-{secrets.token_hex(4)}'
+    cur = conn.cursor()
+    cur.execute("INSERT INTO promo_codes (code, amount, max_uses) VALUES (%s, 10, %s)", (code, max_uses))
+    conn.commit()
+
+    redeemers = [random.choice(user_ids) for _ in range(burst)]
+    results: List[Tuple[float, int, str, int]] = []
+    lock = threading.Lock()
+
+    def redeem(user_id: int) -> None:
+        event = {'httpMethod': 'POST', 'body': json.dumps({'action': 'use_promo', 'user_id': user_id, 'promo_code': code})}
+        _queries.count = 0
+        _queries.announces = 0
+        started = time.perf_counter()
+        response = handler(event, None)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        status = response['statusCode']
+        if status == 200:
+            outcome = 'ok'
+        elif status >= 500:
+            outcome = 'server_error'
+        else:
+            outcome = json.loads(response['body']).get('code') or f'http_{status}'
+        with lock:
+            results.append((elapsed_ms, response['statusCode'], outcome, _queries.count - _queries.announces))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(redeem, redeemers))
+    wall = time.perf_counter() - started
+
+    cur.execute(
+        "SELECT p.current_uses, (SELECT COUNT(*) FROM user_promo_usage u WHERE u.promo_code_id = p.id) "
+        "FROM promo_codes p WHERE p.code = %s",
+        (code,)
+    )
+    current_uses, usage_rows = cur.fetchone()
+    cur.close()
+
+    outcomes: Dict[str, int] = {}
+    for row in results:
+        outcomes[row[2]] = outcomes.get(row[2], 0) + 1
+    latencies = sorted(row[0] for row in results)
+    expected = min(max_uses, len(set(redeemers)))
+    max_statements = max(row[3] for row in results)
+
+    print(f'promo burst: {burst} redemptions of {code} (max_uses {max_uses}) from {len(set(redeemers))} users')
+    print(f'  outcomes: {outcomes}')
+    print(f'  current_uses={current_uses} usage_rows={usage_rows} expected={expected}')
+    print(f'  p50={percentile(latencies, 50):.2f}ms p95={percentile(latencies, 95):.2f}ms '
+          f'p99={percentile(latencies, 99):.2f}ms, {burst / wall:.0f} req/s, '
+          f'statements/request max={max_statements}')
+
+    return (outcomes.get('ok', 0) == current_uses == usage_rows == expected
+            and 'server_error' not in outcomes and max_statements == 1)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark the backend handlers against a local PostgreSQL')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='action=weight pairs')
+    parser.add_argument('--requests', type=int, default=10000)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--setup', action='store_true', help='apply db_migrations/ to an empty database first')
+    parser.add_argument('--save', help='write the report as a baseline JSON file')
+    parser.add_argument('--compare', help='baseline JSON to check for p95 and query-count regressions')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--promo-burst', type=int, default=0, help='also fire N concurrent redemptions of one code')
+    parser.add_argument('--promo-max-uses', type=int, default=100)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    os.environ.setdefault('DB_POOL_MAX', str(args.concurrency))
+    os.environ.setdefault('RATE_LIMITS', BENCH_RATE_LIMITS)
+    install_query_counter()
+
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    if args.setup:
+        apply_migrations(conn)
+    user_ids = seed(conn, args.users)
+    actions, weights = parse_mix(args.mix)
+    if {'crash_bet', 'crash_cashout'} & set(actions):
+        ensure_crash_rounds(conn)
+
+    handlers = {name: load_function_module(name).handler for name in set(ACTION_FUNCTIONS.values())}
+    for action in actions:
+        handlers[ACTION_FUNCTIONS[action]]({'httpMethod': 'POST', 'body': json.dumps(build_body(action, user_ids, user_ids[0]))}, None)
+
+    report = run(handlers, actions, weights, args.requests, args.concurrency, user_ids)
+    print_report(report)
+
+    if args.promo_burst:
+        print()
+        if not promo_burst(handlers['game'], conn, user_ids, args.promo_burst, args.promo_max_uses, args.concurrency):
+            print('PROMO BURST FAILED: redemptions and max_uses disagree, a 5xx came back '
+                  'or a redemption took more than one statement')
+            sys.exit(1)
+    conn.close()
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print('baseline saved to', args.save)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            regressions = compare(report, json.load(f))
+        if regressions:
+            print('\nREGRESSIONS:\n  ' + '\n  '.join(regressions))
+            sys.exit(1)
+        print('no regressions against', args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+'''
+Business: Cold-start benchmark of every backend function - import time and first-request latency in fresh interpreters
+Args: optional DATABASE_URL env; --functions, --runs, --action, --user-id, --modules, --save/--compare baselines
+Returns: median process, import, first-request and warm-request times per function, plus the slowest imports
+
+Each run starts a new Python process, imports backend/<function>/index.py and calls
+handler() twice, so the numbers are what a player waits for on a cold instance
+(minus the platform's own container start). Without DATABASE_URL the ping action
+is called with warm=false, which exercises routing and serialization only.
+
+    python tools/cold_start.py --runs 20 --save bench/cold_start.json
+    python tools/cold_start.py --runs 20 --compare bench/cold_start.json --modules 10
+'''
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from functions import BACKEND_DIR, function_names
+
+# Cheapest representative request per function when a database is available
+DB_REQUESTS = {
+    'auth': {'action': 'get_user'},
+    'admin': {'action': 'get_stats'},
+    'game': {'action': 'get_history'},
+    'games': {'action': 'crash_state'}
+}
+NO_DB_REQUEST = {'action': 'ping', 'warm': False}
+REGRESSION_TOLERANCE = 1.2
+
+CHILD = '''
+import json, sys, time
+started = time.perf_counter()
+sys.path.insert(0, sys.argv[1])
+import index
+imported = time.perf_counter()
+event = sys.argv[2]
+first = index.handler({'httpMethod': 'POST', 'body': event}, None)
+first_done = time.perf_counter()
+index.handler({'httpMethod': 'POST', 'body': event}, None)
+warm_done = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'first_ms': (first_done - imported) * 1000,
+    'warm_ms': (warm_done - first_done) * 1000,
+    'status': first['statusCode'],
+    'modules': len(sys.modules)
+}))
+'''
+
+
+def request_for(function: str, action: Optional[str], user_id: int) -> Dict[str, Any]:
+    if action:
+        body = {'action': action}
+    elif os.environ.get('DATABASE_URL'):
+        body = dict(DB_REQUESTS.get(function, NO_DB_REQUEST))
+    else:
+        body = dict(NO_DB_REQUEST)
+    body['user_id'] = user_id
+    return body
+
+
+def run_once(function: str, body: Dict[str, Any]) -> Dict[str, float]:
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-c', CHILD, os.path.join(BACKEND_DIR, function), json.dumps(body)],
+        capture_output=True, text=True, check=True
+    )
+    sample = json.loads(result.stdout.strip().splitlines()[-1])
+    sample['process_ms'] = (time.perf_counter() - started) * 1000
+    return sample
+
+
+def slowest_imports(function: str, top: int) -> List[tuple]:
+    '''(cumulative ms, module) of the slowest imports under index, from python -X importtime.'''
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import index'],
+        cwd=os.path.join(BACKEND_DIR, function), capture_output=True, text=True, check=True
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if name.strip() != 'index':
+            rows.append((int(cumulative) / 1000, name.rstrip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def measure(functions: List[str], runs: int, action: Optional[str], user_id: int) -> Dict[str, Any]:
+    report: Dict[str, Any] = {'runs': runs, 'functions': {}}
+    for function in functions:
+        body = request_for(function, action, user_id)
+        samples = [run_once(function, body) for _ in range(runs)]
+        report['functions'][function] = {
+            'action': body['action'],
+            'status': samples[0]['status'],
+            'modules': samples[0]['modules'],
+            **{
+                key: statistics.median(s[key] for s in samples)
+                for key in ('process_ms', 'import_ms', 'first_ms', 'warm_ms')
+            }
+        }
+    return report
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    header = (f"{'function':<10}{'action':<14}{'status':>7}{'process ms':>12}{'import ms':>11}"
+              f"{'first ms':>10}{'warm ms':>9}{'modules':>9}")
+    print(header)
+    print('-' * len(header))
+    for function, r in report['functions'].items():
+        print(
+            f"{function:<10}{r['action']:<14}{r['status']:>7}{r['process_ms']:>12.1f}{r['import_ms']:>11.1f}"
+            f"{r['first_ms']:>10.2f}{r['warm_ms']:>9.2f}{r['modules']:>9}"
+        )
+    print(f"\nmedians of {report['runs']} fresh interpreters per function")
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any]) -> List[str]:
+    regressions = []
+    for function, r in report['functions'].items():
+        base = baseline['functions'].get(function)
+        if not base:
+            continue
+        cold = r['import_ms'] + r['first_ms']
+        base_cold = base['import_ms'] + base['first_ms']
+        print(f"{function}: import + first request {base_cold:.1f} -> {cold:.1f} ms "
+              f"({(cold - base_cold) / base_cold * 100:+.0f}%)")
+        if cold > base_cold * REGRESSION_TOLERANCE:
+            regressions.append(f'{function}: import + first request {base_cold:.1f} -> {cold:.1f} ms')
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Measure cold-start time of the backend functions')
+    parser.add_argument('--functions', default=','.join(function_names()), help='comma-separated function names')
+    parser.add_argument('--runs', type=int, default=10, help='fresh interpreters per function')
+    parser.add_argument('--action', help='action to call instead of the per-function default')
+    parser.add_argument('--user-id', type=int, default=1)
+    parser.add_argument('--modules', type=int, default=0, help='also list the N slowest imports per function')
+    parser.add_argument('--save', help='write the report as a baseline JSON file')
+    parser.add_argument('--compare', help='baseline JSON to check for cold-start regressions')
+    args = parser.parse_args()
+
+    functions = [name.strip() for name in args.functions.split(',') if name.strip()]
+    report = measure(functions, args.runs, args.action, args.user_id)
+    print_report(report)
+
+    for function in functions if args.modules else ():
+        print(f'\nslowest imports in {function}:')
+        for cumulative, name in slowest_imports(function, args.modules):
+            print(f'  {cumulative:8.1f} ms  {name}')
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print('baseline saved to', args.save)
+
+    if args.compare:
+        print()
+        with open(args.compare, encoding='utf-8') as f:
+            regressions = compare(report, json.load(f))
+        if regressions:
+            print('\nREGRESSIONS:\n  ' + '\n  '.join(regressions))
+            sys.exit(1)
+        print('no regressions against', args.compare)
+
+
+if __name__ == '__main__':
+    main()
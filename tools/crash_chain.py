@@ -0,0 +1,91 @@
+'''
+Business: Generate the next stretch of Crash rounds from a SHA-256 hash chain
+Args: DATABASE_URL env; --rounds to append, --seed (secret, random if omitted)
+Returns: rows appended to crash_rounds and the chain's terminating hash to publish
+
+The chain is built forward from the seed (h1 = sha256(seed), h2 = sha256(h1), ...)
+and played backwards, so once a round's hash is revealed anyone can check that
+sha256(hash) equals the hash of the round before it. Crash points and timings use
+backend/games/rules.py, the same code the games function settles with.
+
+    DATABASE_URL=postgres://... python tools/crash_chain.py --rounds 30000
+'''
+
+import argparse
+import hashlib
+import os
+import secrets
+import sys
+import time
+from datetime import timedelta, timezone
+from typing import Any, List
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from functions import load_function_module
+
+rules = load_function_module('games', 'rules')
+
+
+def build_chain(seed: str, length: int) -> List[str]:
+    chain = []
+    current = seed.encode()
+    for _ in range(length):
+        current = hashlib.sha256(current).hexdigest().encode()
+        chain.append(current.decode())
+    chain.reverse()
+    return chain
+
+
+def append_rounds(conn: Any, chain: List[str]) -> List[tuple]:
+    '''Schedules the chain's rounds right after the last existing round; returns the inserted rows.'''
+    cur = conn.cursor()
+    cur.execute("LOCK TABLE crash_rounds IN EXCLUSIVE MODE")
+    cur.execute("SELECT COALESCE(MAX(id), 0), MAX(crashes_at), clock_timestamp() FROM crash_rounds")
+    last_id, last_crash, db_now = cur.fetchone()
+
+    opens_at = max(last_crash + timedelta(seconds=rules.CRASH_COOLDOWN_SECONDS), db_now) if last_crash else db_now
+    rows = []
+    for offset, round_hash in enumerate(chain, start=1):
+        point = rules.crash_point_from_hash(round_hash)
+        starts_at = opens_at + timedelta(seconds=rules.CRASH_BETTING_SECONDS)
+        crashes_at = starts_at + timedelta(seconds=rules.crash_flight_seconds(point))
+        rows.append((last_id + offset, round_hash, point, opens_at, starts_at, crashes_at))
+        opens_at = crashes_at + timedelta(seconds=rules.CRASH_COOLDOWN_SECONDS)
+
+    execute_values(
+        cur,
+        "INSERT INTO crash_rounds (id, hash, crash_point, betting_opens_at, starts_at, crashes_at) VALUES %s",
+        rows,
+        page_size=1000
+    )
+    conn.commit()
+    cur.close()
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Append hash-chain Crash rounds to crash_rounds')
+    parser.add_argument('--rounds', type=int, default=30000, help='about a week at the default timings')
+    parser.add_argument('--seed', default=None, help='secret chain seed; keep it private')
+    args = parser.parse_args()
+
+    seed = args.seed or secrets.token_hex(32)
+    started = time.perf_counter()
+    chain = build_chain(seed, args.rounds)
+
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    rows = append_rounds(conn, chain)
+    conn.close()
+
+    print(f'appended rounds {rows[0][0]}..{rows[-1][0]} in {time.perf_counter() - started:.1f}s')
+    print(f'schedule ends at {rows[-1][5].astimezone(timezone.utc).isoformat()}')
+    print(f'terminating hash (publish): {hashlib.sha256(chain[0].encode()).hexdigest()}')
+    if not args.seed:
+        print(f'seed (store securely): {seed}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+'''
+Business: Import modules of the backend cloud functions from offline tools
+Args: function directory name (backend/<function>) and module name
+Returns: the imported module, with sibling imports (db, cases, ...) resolved inside that function
+'''
+
+import importlib
+import os
+import sys
+from types import ModuleType
+from typing import Dict, List, Tuple
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend')
+
+_loaded: Dict[Tuple[str, str], ModuleType] = {}
+
+
+def function_names() -> List[str]:
+    return sorted(
+        name for name in os.listdir(BACKEND_DIR)
+        if os.path.isfile(os.path.join(BACKEND_DIR, name, 'index.py'))
+    )
+
+
+def load_function_module(function: str, module: str = 'index') -> ModuleType:
+    '''Functions reuse module names (every one has index.py and db.py), so each is imported in isolation.'''
+    if (function, module) in _loaded:
+        return _loaded[(function, module)]
+
+    directory = os.path.join(BACKEND_DIR, function)
+    siblings = {f[:-3] for f in os.listdir(directory) if f.endswith('.py')}
+    for name in siblings:
+        sys.modules.pop(name, None)
+        if (function, name) in _loaded:
+            sys.modules[name] = _loaded[(function, name)]
+
+    sys.path.insert(0, directory)
+    try:
+        imported = importlib.import_module(module)
+    finally:
+        sys.path.remove(directory)
+        for name in siblings:
+            loaded = sys.modules.pop(name, None)
+            if loaded is not None:
+                _loaded[(function, name)] = loaded
+    return imported
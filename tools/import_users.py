@@ -0,0 +1,120 @@
+'''
+Business: Bulk-provision users through COPY for migrations and load testing
+Args: DATABASE_URL env; --csv with phone_number[,name,email,balance] rows or --generate N synthetic phones
+Returns: loaded/inserted/skipped counts and throughput in users/sec
+
+Rows are streamed in chunks into a temporary staging table with COPY and moved
+into users with one INSERT ... SELECT ... ON CONFLICT DO NOTHING per chunk, so
+existing phone numbers are skipped and the statement-level casino_stats triggers
+fire once per chunk. Names and emails default to what the login action creates.
+
+    DATABASE_URL=postgres://... python tools/import_users.py --generate 1000000
+    DATABASE_URL=postgres://... python tools/import_users.py --csv users.csv
+'''
+
+import argparse
+import csv
+import io
+import os
+import time
+from typing import Iterator, List, Tuple
+
+import psycopg2
+
+STAGING_SQL = '''
+CREATE TEMP TABLE IF NOT EXISTS users_import (
+  google_id VARCHAR(255),
+  email VARCHAR(255),
+  name VARCHAR(255),
+  balance DECIMAL(10, 2)
+) ON COMMIT DELETE ROWS
+'''
+
+MOVE_SQL = '''
+INSERT INTO users (google_id, email, name, balance)
+SELECT google_id, email, name, balance FROM users_import
+ON CONFLICT DO NOTHING
+'''
+
+Row = Tuple[str, str, str, str]
+
+
+def login_defaults(phone_number: str, name: str = '', email: str = '', balance: str = '') -> Row:
+    '''Same name/email the login action derives for a new phone number.'''
+    return (
+        phone_number,
+        email or f'{phone_number}@phone.user',
+        name or f'User{phone_number[-4:]}',
+        balance or '0'
+    )
+
+
+def generated_rows(count: int, prefix: str, balance: str) -> Iterator[Row]:
+    for i in range(count):
+        yield login_defaults(f'{prefix}{i:07d}', balance=balance)
+
+
+def csv_rows(path: str) -> Iterator[Row]:
+    with open(path, newline='') as f:
+        for record in csv.DictReader(f):
+            yield login_defaults(
+                record['phone_number'], record.get('name') or '', record.get('email') or '',
+                record.get('balance') or ''
+            )
+
+
+def chunks(rows: Iterator[Row], size: int) -> Iterator[List[Row]]:
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def copy_chunk(cur, chunk: List[Row]) -> int:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(chunk)
+    buffer.seek(0)
+    cur.copy_expert("COPY users_import (google_id, email, name, balance) FROM STDIN WITH (FORMAT csv)", buffer)
+    cur.execute(MOVE_SQL)
+    return cur.rowcount
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Bulk-import users with COPY')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--csv', help='CSV with a header: phone_number[,name,email,balance]')
+    source.add_argument('--generate', type=int, help='Number of synthetic users to create')
+    parser.add_argument('--prefix', default='+7000', help='Phone prefix for --generate')
+    parser.add_argument('--balance', default='0', help='Starting balance for --generate')
+    parser.add_argument('--chunk', type=int, default=100000, help='Rows per COPY/commit')
+    args = parser.parse_args()
+
+    rows = csv_rows(args.csv) if args.csv else generated_rows(args.generate, args.prefix, args.balance)
+
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    cur = conn.cursor()
+    cur.execute(STAGING_SQL)
+
+    loaded = inserted = 0
+    started = time.perf_counter()
+    for chunk in chunks(rows, args.chunk):
+        inserted += copy_chunk(cur, chunk)
+        conn.commit()
+        loaded += len(chunk)
+        elapsed = time.perf_counter() - started
+        print(f'{loaded:>12,} loaded  {inserted:>12,} inserted  {loaded / elapsed:>10,.0f} users/sec')
+
+    elapsed = time.perf_counter() - started
+    print(f'done: {loaded:,} rows, {inserted:,} inserted, {loaded - inserted:,} skipped (already present) '
+          f'in {elapsed:.2f}s = {inserted / elapsed if elapsed else 0:,.0f} users/sec')
+
+    cur.close()
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+'''
+Business: Maintain the monthly partitions of balance_ledger and case_openings
+Args: DATABASE_URL env; --table (default: all), --ahead months to pre-create, --retain months to keep, --drop
+Returns: names of the partitions created and dropped
+
+Run monthly (cron or CI schedule) so writes never fall into the *_default partitions:
+
+    DATABASE_URL=postgres://... python tools/ledger_partitions.py --ahead 3 --retain 24 --drop
+'''
+
+import argparse
+import os
+from datetime import date
+
+import psycopg2
+
+# partitioned table -> function that creates one month (migrations V0005, V0011)
+TABLES = {
+    'balance_ledger': 'create_balance_ledger_partition',
+    'case_openings': 'create_case_openings_partition'
+}
+
+
+def add_months(day: date, months: int) -> date:
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Create and prune monthly partitions')
+    parser.add_argument('--table', action='append', choices=sorted(TABLES), help='repeatable; default: all')
+    parser.add_argument('--ahead', type=int, default=3)
+    parser.add_argument('--retain', type=int, default=24, help='months of history to keep')
+    parser.add_argument('--drop', action='store_true', help='drop partitions older than --retain')
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    cur = conn.cursor()
+    this_month = date.today().replace(day=1)
+
+    for table in args.table or list(TABLES):
+        for offset in range(args.ahead + 1):
+            cur.execute(f"SELECT {TABLES[table]}(%s)", (add_months(this_month, offset),))
+            print('ensured', cur.fetchone()[0])
+
+        cutoff = add_months(this_month, -args.retain).strftime(f'{table}_%Y_%m')
+        cur.execute(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = %s::regclass AND c.relname ~ %s "
+            "AND c.relname < %s ORDER BY c.relname",
+            (table, f'^{table}_[0-9]{{4}}_[0-9]{{2}}$', cutoff)
+        )
+        for (name,) in cur.fetchall():
+            if args.drop:
+                cur.execute(f'ALTER TABLE {table} DETACH PARTITION "{name}"')
+                cur.execute(f'DROP TABLE "{name}"')
+                print('dropped', name)
+            else:
+                print('expired (use --drop to remove)', name)
+
+    conn.commit()
+    cur.close()
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
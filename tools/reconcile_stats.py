@@ -0,0 +1,55 @@
+'''
+Business: Rebuild the casino_stats counters from the raw users and case_openings tables
+Args: DATABASE_URL env; --dry-run only reports the drift
+Returns: per-counter drift between the maintained totals and a fresh aggregate
+
+    DATABASE_URL=postgres://... python tools/reconcile_stats.py
+'''
+
+import argparse
+import os
+
+import psycopg2
+
+COUNTERS = ('total_users', 'total_balance', 'total_cases_opened', 'total_winnings')
+
+MAINTAINED_SQL = (
+    "SELECT COALESCE(SUM(total_users), 0), COALESCE(SUM(total_balance), 0), "
+    "COALESCE(SUM(total_cases_opened), 0), COALESCE(SUM(total_winnings), 0) FROM casino_stats"
+)
+
+RAW_SQL = (
+    "SELECT (SELECT COUNT(*) FROM users), (SELECT COALESCE(SUM(balance), 0) FROM users), "
+    "(SELECT COUNT(*) FROM case_openings), (SELECT COALESCE(SUM(prize_amount), 0) FROM case_openings)"
+)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Reconcile casino_stats with the raw tables')
+    parser.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    cur = conn.cursor()
+
+    cur.execute(MAINTAINED_SQL)
+    maintained = cur.fetchone()
+    cur.execute(RAW_SQL)
+    raw = cur.fetchone()
+
+    for name, kept, actual in zip(COUNTERS, maintained, raw):
+        print(f'{name:<20} maintained={kept:<16} actual={actual:<16} drift={kept - actual}')
+
+    if args.dry_run:
+        conn.rollback()
+    else:
+        cur.execute("SELECT reconcile_casino_stats()")
+        conn.commit()
+        print('casino_stats rebuilt')
+
+    cur.close()
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
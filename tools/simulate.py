@@ -0,0 +1,194 @@
+'''
+Business: Offline Monte Carlo RTP simulator for every case and mini-game
+Args: --rounds per game, --workers, --chunk, --seed, strategy knobs for crash/mines
+Returns: table (or JSON) with RTP, house edge, hit rate, volatility and tail percentiles
+
+Uses backend/game/cases.py and backend/games/rules.py directly, so the odds and
+payouts are exactly the ones the handlers apply. Requires NumPy (tools/requirements.txt).
+
+    python tools/simulate.py --rounds 100000000
+    python tools/simulate.py --games bomj,crash --crash-target 1.5 --json
+'''
+
+import argparse
+import json
+import os
+import sys
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from functions import load_function_module
+
+cases = load_function_module('game', 'cases')
+rules = load_function_module('games', 'rules')
+
+MINI_GAMES = ('coinflip', 'cards', 'crash', 'mines')
+PERCENTILES = (1, 5, 50, 95, 99)
+
+
+def game_stake(game: str) -> float:
+    if game in cases.CASES:
+        return float(cases.CASES[game]['price'])
+    return float(rules.MIN_BETS[game])
+
+
+def simulate_payouts(game: str, n: int, rng: np.random.Generator, options: Dict[str, Any]) -> np.ndarray:
+    stake = game_stake(game)
+
+    if game in cases.CASES:
+        return cases.seed_tables()[game].draw_array(n, rng)
+
+    if game == 'coinflip':
+        choice = 0
+        won = rules.coinflip_side(rng.random(n)) == choice
+        return rules.coinflip_payout(stake, won)
+
+    if game == 'cards':
+        return rules.cards_payout(stake, rules.cards_won(rng.random(n)))
+
+    if game == 'crash':
+        points = rules.crash_point_cents(rng.random(n), rng.random(n))
+        return rules.crash_payout(stake, options['crash_target'], points)
+
+    if game == 'mines':
+        mines, revealed = options['mines_count'], options['mines_reveals']
+        survived = rng.random(n) < rules.mines_survival(mines, revealed)
+        return rules.mines_payout(stake, mines, revealed, survived)
+
+    raise ValueError(f'Unknown game {game}')
+
+
+def run_chunk(task: Tuple[str, int, int, int, Dict[str, Any]]) -> Dict[str, Any]:
+    game, n, session, seed, options = task
+    rng = np.random.default_rng(seed)
+    stake = game_stake(game)
+
+    returns = simulate_payouts(game, n, rng, options) / stake
+    values, counts = np.unique(returns, return_counts=True)
+    usable = n - n % session
+    sessions = (returns[:usable].reshape(-1, session) - 1.0).sum(axis=1)
+
+    return {
+        'rounds': n,
+        'sum': float(returns.sum()),
+        'sum_sq': float(np.square(returns).sum()),
+        'hits': int((returns > 1.0).sum()),
+        'values': values,
+        'counts': counts,
+        'sessions': sessions
+    }
+
+
+def merge(chunks: List[Dict[str, Any]]) -> Dict[str, Any]:
+    values = np.concatenate([c['values'] for c in chunks])
+    counts = np.concatenate([c['counts'] for c in chunks])
+    distinct, inverse = np.unique(values, return_inverse=True)
+    return {
+        'rounds': sum(c['rounds'] for c in chunks),
+        'sum': sum(c['sum'] for c in chunks),
+        'sum_sq': sum(c['sum_sq'] for c in chunks),
+        'hits': sum(c['hits'] for c in chunks),
+        'values': distinct,
+        'counts': np.bincount(inverse, weights=counts),
+        'sessions': np.concatenate([c['sessions'] for c in chunks])
+    }
+
+
+def weighted_percentiles(values: np.ndarray, counts: np.ndarray, qs: Tuple[int, ...]) -> List[float]:
+    cumulative = np.cumsum(counts) / counts.sum()
+    return [float(values[np.searchsorted(cumulative, q / 100.0)]) for q in qs]
+
+
+def summarize(game: str, total: Dict[str, Any], session: int) -> Dict[str, Any]:
+    n = total['rounds']
+    rtp = total['sum'] / n
+    variance = total['sum_sq'] / n - rtp ** 2
+    report = {
+        'game': game,
+        'stake': game_stake(game),
+        'rounds': n,
+        'rtp': rtp,
+        'house_edge': 1.0 - rtp,
+        'hit_rate': total['hits'] / n,
+        'std_per_round': float(np.sqrt(max(variance, 0.0))),
+        'round_return_percentiles': dict(zip(
+            (f'p{q}' for q in PERCENTILES + (99.9,)),
+            weighted_percentiles(total['values'], total['counts'], PERCENTILES + (99.9,))
+        ))
+    }
+    if total['sessions'].size:
+        report[f'session_{session}_net_percentiles'] = dict(zip(
+            (f'p{q}' for q in PERCENTILES),
+            (float(v) for v in np.percentile(total['sessions'], PERCENTILES))
+        ))
+    return report
+
+
+def simulate(game: str, rounds: int, chunk: int, session: int, seed: int,
+             options: Dict[str, Any], executor: ProcessPoolExecutor) -> Dict[str, Any]:
+    sizes = [chunk] * (rounds // chunk) + ([rounds % chunk] if rounds % chunk else [])
+    seeds = np.random.SeedSequence([seed, zlib.crc32(game.encode())]).spawn(len(sizes))
+    tasks = [(game, size, session, s.generate_state(1)[0], options) for size, s in zip(sizes, seeds)]
+    return summarize(game, merge(list(executor.map(run_chunk, tasks))), session)
+
+
+def print_table(reports: List[Dict[str, Any]]) -> None:
+    header = f"{'game':<10}{'rounds':>14}{'RTP':>9}{'edge':>9}{'hit':>8}{'std':>9}{'p99':>8}{'p99.9':>9}"
+    print(header)
+    print('-' * len(header))
+    for r in reports:
+        pct = r['round_return_percentiles']
+        print(
+            f"{r['game']:<10}{r['rounds']:>14,}{r['rtp']:>9.4f}{r['house_edge']:>9.4f}"
+            f"{r['hit_rate']:>8.4f}{r['std_per_round']:>9.4f}{pct['p99']:>8.2f}{pct['p99.9']:>9.2f}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Monte Carlo RTP simulator for cases and mini-games')
+    parser.add_argument('--games', default=','.join(list(cases.CASES) + list(MINI_GAMES)))
+    parser.add_argument('--rounds', type=int, default=100_000_000)
+    parser.add_argument('--chunk', type=int, default=2_000_000, help='rounds per worker task')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--session', type=int, default=100, help='rounds per session for session P&L percentiles')
+    parser.add_argument('--seed', type=int, default=int(time.time()))
+    parser.add_argument('--crash-target', type=float, default=2.0, help='auto cash-out multiplier')
+    parser.add_argument('--mines-count', type=int, default=rules.MINES_DEFAULT_COUNT)
+    parser.add_argument('--mines-reveals', type=int, default=3, help='safe cells revealed before cashing out')
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    games = [g for g in args.games.split(',') if g]
+    unknown = [g for g in games if g not in cases.CASES and g not in MINI_GAMES]
+    if unknown:
+        parser.error(f"unknown games: {', '.join(unknown)}")
+
+    if not rules.MINES_MIN_COUNT <= args.mines_count <= rules.MINES_MAX_COUNT:
+        parser.error('--mines-count out of range')
+    if not 1 <= args.mines_reveals <= rules.MINES_CELLS - args.mines_count:
+        parser.error('--mines-reveals must leave at least one mine-free cell per reveal')
+
+    options = {
+        'crash_target': args.crash_target,
+        'mines_count': args.mines_count,
+        'mines_reveals': args.mines_reveals
+    }
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        reports = [simulate(g, args.rounds, args.chunk, args.session, args.seed, options, executor) for g in games]
+    elapsed = time.perf_counter() - started
+
+    if args.json:
+        print(json.dumps({'seed': args.seed, 'elapsed_s': elapsed, 'options': options, 'reports': reports}, indent=2))
+    else:
+        print_table(reports)
+        print(f'\nseed={args.seed} elapsed={elapsed:.1f}s options={options}')
+
+
+if __name__ == '__main__':
+    main()